@@ -0,0 +1,174 @@
+"""
+推測ロジックとアプリ起動のベンチマーク。
+
+    python bench.py --json bench.json                 # 計測してJSONに保存
+    python bench.py --compare bench.json              # 前回の結果と比較
+
+計測項目:
+  single/*       predict_setting 1件あたりの時間（最小入力 / 典型的な入力 / 全項目入力）
+  batch/*        predict_setting_batch のスループット（1k / 10k / 100k件）
+  import/*       新しいプロセスでの import 時間（core / app）
+  streamlit/*    Streamlit スクリプトの再実行時間（streamlit がある場合のみ）
+入力データは固定シードで生成するので、コミット間で同じ条件で比べられる。
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import core
+from simulate import simulate_sessions
+
+ROOT = Path(__file__).resolve().parent
+SEED = 0
+
+MINIMAL_INPUT = {"total_game_count": 3000, "at_first_hit_count": 10}
+
+TYPICAL_INPUT = {
+    "total_game_count": 5000,
+    "cz_total_count": 22,
+    "at_first_hit_count": 15,
+    "weak_cherry_count": 60,
+    "weak_cherry_cz_count_normal": 1,
+    "lower_replay_count": 4,
+    "ep_bonus_count": 1,
+    "AT終了画面_旧多二福（月）": 1,
+    "エンディングカード_高設定示唆[弱]": 2,
+}
+
+
+def full_input():
+    """全ての入力キーに値が入った1件（固定シード）"""
+    rng = np.random.default_rng(SEED)
+    inputs = {key: int(rng.integers(1, 20)) for key in core.INPUT_KEYS}
+    inputs["total_game_count"] = 8000
+    return inputs
+
+
+def batch_input(num_records):
+    """設定1〜6を順に混ぜた num_records 件の列データ（固定シード）"""
+    rng = np.random.default_rng(SEED)
+    sizes = [len(part) for part in np.array_split(np.arange(num_records), 6)]
+    parts = [
+        simulate_sessions(setting, size, 5000, rng, trial_rates={"weak_cherry_count": 1 / 80})
+        for setting, size in enumerate(sizes, start=1)
+    ]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def measure(function, repeats, number=1):
+    """function を number 回実行する計測を repeats 回行い、1回あたりの秒数のリストを返す"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def result(name, timings, unit="s", **extra):
+    return {"name": name, "unit": unit, "median": statistics.median(timings), "min": min(timings), "repeats": len(timings), **extra}
+
+
+def bench_single(repeats):
+    cases = {"minimal": MINIMAL_INPUT, "typical": TYPICAL_INPUT, "full": full_input()}
+    for name, inputs in cases.items():
+        core.predict_setting(inputs) # 初回のSciPy読み込みを計測から外す
+        yield result(f"single/{name}", measure(lambda: core.predict_setting(inputs), repeats, number=200))
+
+
+def bench_batch(repeats, sizes):
+    for size in sizes:
+        columns = batch_input(size)
+        core.predict_setting_batch(columns)
+        timings = measure(lambda: core.predict_setting_batch(columns), repeats)
+        yield result(f"batch/{size}", timings, records_per_second=size / statistics.median(timings))
+
+
+def bench_import(repeats):
+    for module in ("core", "app"):
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        timings = []
+        for _ in range(repeats):
+            completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+            if completed.returncode != 0:
+                break
+            timings.append(float(completed.stdout.strip().splitlines()[-1]))
+        if timings:
+            yield result(f"import/{module}", timings)
+
+
+def bench_streamlit(repeats):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return
+    app_test = AppTest.from_file(str(ROOT / "app.py"), default_timeout=60)
+    app_test.run()
+    yield result("streamlit/initial_rerun", measure(app_test.run, repeats))
+
+    for key, value in TYPICAL_INPUT.items():
+        if key in {widget.key for widget in app_test.number_input}:
+            app_test.number_input(key=key).set_value(value)
+    app_test.button[0].click().run()
+    yield result("streamlit/submit_rerun", measure(lambda: app_test.button[0].click().run(), repeats))
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "commit": commit}
+
+
+def format_value(entry):
+    value = entry["median"]
+    return f"{value * 1e6:10.1f} µs" if value < 1e-3 else f"{value * 1e3:10.2f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="推測ロジックとアプリ起動のベンチマーク")
+    parser.add_argument("--repeats", type=int, default=5, help="各項目の計測回数")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="一括推測の件数")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["single", "batch", "import", "streamlit"], help="計測しない項目")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    parser.add_argument("--compare", help="比較対象の結果（--json で保存したファイル）")
+    args = parser.parse_args(argv)
+
+    benches = {
+        "single": lambda: bench_single(args.repeats),
+        "batch": lambda: bench_batch(args.repeats, args.sizes),
+        "import": lambda: bench_import(args.repeats),
+        "streamlit": lambda: bench_streamlit(args.repeats),
+    }
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as compare_file:
+            baseline = {entry["name"]: entry for entry in json.load(compare_file)["results"]}
+
+    results = []
+    for group, bench in benches.items():
+        if group in args.skip:
+            continue
+        for entry in bench():
+            results.append(entry)
+            line = f"{entry['name']:<28}{format_value(entry)}"
+            if entry["name"] in baseline:
+                line += f"  ({entry['median'] / baseline[entry['name']]['median']:.2f}x)"
+            print(line, flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"environment": environment(), "seed": SEED, "results": results}, json_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
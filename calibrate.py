@@ -0,0 +1,280 @@
+"""
+示唆の倍率（HINT_DATA の value_multiplier / exclude_multiplier）を、設定が分かっているセッションから最尤推定し、
+スペック表の新しい版として書き出す。
+
+    python calibrate.py --labeled 設定判明.csv --setting-column 設定 --schema schema.json
+    python calibrate.py --simulate 100000 --games 5000 --output-dir /tmp/specs
+
+倍率は「AT初当り1回あたりの示唆の出現率」の設定間の比とみなす。示唆ごとに、value_multiplier が掛かる設定の
+セッションと exclude_multiplier が掛かる設定のセッションで、出現回数とAT初当り回数をそれぞれ合計し、
+二項分布の最尤推定値（出現回数 / AT初当り回数）の比から対数比 d = log(value / exclude) を求める。
+出現しなかったAT初当りも分母に入るので、「出なかった」ことも推定に反映される。
+exclude_multiplier は元の値のまま、value_multiplier = exclude_multiplier·exp(d) として書き出す（normal の示唆は対象外）。
+
+片方の設定での出現回数が min-count 未満の示唆（濃厚・否定系など）は、その側の出現率の95%上側限界から比の
+下限・上限しか分からないので、元の値がその範囲内なら元の値のまま、範囲外なら限界値にする。
+両方の設定で min-count 未満の示唆は元の値のまま。
+書き出す前に、元のスペック表の倍率で作った疑似セッションからその倍率を推定し直せることを確かめる。
+"""
+import argparse
+import csv
+import math
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from core import compile_model, hint_multipliers
+from ingest import load_schema, resolve_schema, to_counts
+from simulate import DEFAULT_HINT_RATE, simulate_sessions
+from spec_registry import DEFAULT_MACHINE, SpecError, available_revisions, load_spec, write_spec
+
+DEFAULT_MIN_COUNT = 10 # 出現率を推定値として使う出現回数の下限（value / exclude の設定それぞれ）
+UPPER_LIMIT_Z = 1.645 # 出現回数の期待値の上側限界に使う正規分布の分位点（片側95%）
+MAX_LOG_RATIO = 30.0 # 対数比の上限・下限（倍率の比で約1e13）
+RECOVERY_TOLERANCE = 0.25 # 推定し直した対数比と元の対数比の差の許容幅（標準誤差が大きければ RECOVERY_SIGMAS 倍まで）
+RECOVERY_SIGMAS = 4.0
+DEFAULT_CHECK_SESSIONS = 100_000
+DEFAULT_CHECK_GAMES = 5000
+DEFAULT_SETTING_COLUMN = "setting"
+SEED = 0
+
+# 推定に使う集計値（いずれも形状(H,)）
+# value_appearances / exclude_appearances: value / exclude の倍率が掛かる設定のセッションでの出現回数の合計、
+# value_hits / exclude_hits: 同じセッションのAT初当り回数の合計
+AppearanceCounts = namedtuple("AppearanceCounts", ["value_appearances", "value_hits", "exclude_appearances",
+                                                   "exclude_hits"])
+# 推定結果
+# hint_keys: 推定した示唆、log_ratios / initial_log_ratios: 推定後・推定前の対数比、
+# standard_errors: 対数比の標準誤差（両方の設定で十分に出現した示唆のみ、それ以外はNaN）、
+# statuses: 示唆ごとの推定の状態（"推定" / "下限" / "上限" / "不足"）
+CalibrationResult = namedtuple("CalibrationResult", ["hint_keys", "log_ratios", "initial_log_ratios",
+                                                     "standard_errors", "statuses"])
+
+
+def value_settings(hint_info):
+    """value_multiplier が掛かる設定を1、exclude_multiplier が掛かる設定を0にした形状(6,)の配列"""
+    return np.log(hint_multipliers({**hint_info, "value_multiplier": math.e, "exclude_multiplier": 1.0}))
+
+
+def fittable_hints(hint_data):
+    """対数比を推定できる示唆（value / exclude の掛かる設定が両方ある）の (キーのリスト, 形状(H, 6)の value_settings)"""
+    keys, indicators = [], []
+    for hint_key, hint_info in hint_data.items():
+        indicator = value_settings(hint_info)
+        if 0 < indicator.sum() < 6:
+            keys.append(hint_key)
+            indicators.append(indicator)
+    return keys, np.array(indicators).reshape(len(keys), 6)
+
+
+def log_ratios(hint_data, hint_keys):
+    """示唆ごとの現在の log(value_multiplier / exclude_multiplier)（省略時の値は core.hint_multipliers と同じ）"""
+    ratios = []
+    for hint_key in hint_keys:
+        multipliers = np.array(hint_multipliers(hint_data[hint_key]))
+        indicator = value_settings(hint_data[hint_key]).astype(bool)
+        ratios.append(math.log(multipliers[indicator][0]) - math.log(multipliers[~indicator][0]))
+    return np.array(ratios)
+
+
+def prepare(columns, settings, hint_keys, indicators):
+    """
+    ラベル付きのセッション（入力キー → 長さNの配列、settings: 長さNの1〜6）から AppearanceCounts を作る。
+    示唆の出現の機会はAT初当りごとにあるものとするので、at_first_hit_count の列が必要。
+    """
+    settings = np.asarray(settings, dtype=int).reshape(-1)
+    if settings.size and (settings.min() < 1 or settings.max() > 6):
+        raise ValueError("設定は1〜6で指定してください")
+    if "at_first_hit_count" not in columns:
+        raise ValueError("示唆の出現率の分母になる at_first_hit_count の列がありません")
+    at_hits = np.asarray(columns["at_first_hit_count"], dtype=float).reshape(-1)
+    hint_counts = np.column_stack([
+        np.asarray(columns[key], dtype=float).reshape(-1) if key in columns else np.zeros(len(settings)) for key in hint_keys
+    ]).reshape(len(settings), len(hint_keys))
+    in_value = indicators[:, settings - 1].T.astype(bool) # 形状(N, H): そのセッションの設定に value_multiplier が掛かるか
+    return AppearanceCounts((hint_counts * in_value).sum(axis=0), in_value.T @ at_hits,
+                            (hint_counts * ~in_value).sum(axis=0), (~in_value).T @ at_hits)
+
+
+def poisson_upper_limit(counts):
+    """出現回数 counts のときの、出現回数の期待値の片側95%上側限界（Wilson–Hilferty 近似。0回なら約3）"""
+    shifted = np.asarray(counts, dtype=float) + 1
+    return shifted * (1 - 1 / (9 * shifted) + UPPER_LIMIT_Z / (3 * np.sqrt(shifted))) ** 3
+
+
+def calibrate(counts, hint_keys, initial_ratios, min_count=DEFAULT_MIN_COUNT):
+    """示唆ごとの対数比を出現率の比から推定して CalibrationResult を返す"""
+    initial_ratios = np.clip(initial_ratios, -MAX_LOG_RATIO, MAX_LOG_RATIO)
+    value_count, value_hits = counts.value_appearances, counts.value_hits
+    exclude_count, exclude_hits = counts.exclude_appearances, counts.exclude_hits
+    ratios = initial_ratios.copy()
+    standard_errors = np.full(len(hint_keys), np.nan)
+    statuses = np.full(len(hint_keys), "不足", dtype=object)
+    observed = (value_hits > 0) & (exclude_hits > 0)
+    value_enough, exclude_enough = observed & (value_count >= min_count), observed & (exclude_count >= min_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value_rate, exclude_rate = value_count / value_hits, exclude_count / exclude_hits
+        # 両方で十分に出現した示唆は出現率の比（二項分布の最尤推定値の比）、標準誤差はデルタ法
+        both = value_enough & exclude_enough
+        ratios[both] = np.log(value_rate[both] / exclude_rate[both])
+        standard_errors[both] = np.sqrt(1 / value_count[both] - 1 / value_hits[both]
+                                        + 1 / exclude_count[both] - 1 / exclude_hits[both])
+        statuses[both] = "推定"
+        # exclude の設定でほとんど出ていなければ、比は下限しか分からない
+        value_only = value_enough & ~exclude_enough
+        lower = np.log(value_rate * exclude_hits / poisson_upper_limit(exclude_count))
+        ratios[value_only] = np.maximum(initial_ratios, lower)[value_only]
+        statuses[value_only] = "下限"
+        # value の設定でほとんど出ていなければ、比は上限しか分からない
+        exclude_only = exclude_enough & ~value_enough
+        upper = np.log(poisson_upper_limit(value_count) / value_hits / exclude_rate)
+        ratios[exclude_only] = np.minimum(initial_ratios, upper)[exclude_only]
+        statuses[exclude_only] = "上限"
+    return CalibrationResult(hint_keys, np.clip(ratios, -MAX_LOG_RATIO, MAX_LOG_RATIO), initial_ratios,
+                             standard_errors, statuses.tolist())
+
+
+def recovery_errors(result, true_ratios, tolerance=RECOVERY_TOLERANCE):
+    """
+    推定値が真の対数比から許容幅（tolerance と標準誤差の RECOVERY_SIGMAS 倍の大きい方）を超えて外れた示唆の
+    (キー, 真の対数比, 推定値, 許容幅) のリスト
+    """
+    allowed = np.fmax(tolerance, RECOVERY_SIGMAS * result.standard_errors)
+    errors = np.abs(result.log_ratios - np.clip(true_ratios, -MAX_LOG_RATIO, MAX_LOG_RATIO))
+    return [(hint_key, float(true_ratio), float(ratio), float(limit))
+            for hint_key, true_ratio, ratio, error, limit in zip(result.hint_keys, true_ratios, result.log_ratios,
+                                                                 errors, allowed)
+            if error > limit]
+
+
+def check_recovery(spec, num_sessions=DEFAULT_CHECK_SESSIONS, games=DEFAULT_CHECK_GAMES, hint_rate=DEFAULT_HINT_RATE,
+                   min_count=DEFAULT_MIN_COUNT, seed=SEED):
+    """スペック表の倍率で作った疑似セッションから、同じ倍率を推定し直せるか調べる。戻り値は recovery_errors と同じ"""
+    model = compile_model(spec.game_data, spec.hint_data)
+    hint_keys, indicators = fittable_hints(spec.hint_data)
+    true_ratios = log_ratios(spec.hint_data, hint_keys)
+    columns, settings = simulated_sessions(num_sessions, games, model, hint_rate, seed)
+    result = calibrate(prepare(columns, settings, hint_keys, indicators), hint_keys, true_ratios, min_count)
+    return recovery_errors(result, true_ratios)
+
+
+def calibrated_hint_data(hint_data, result):
+    """推定した対数比を反映した HINT_DATA のコピー（exclude_multiplier は元の値のまま）"""
+    calibrated = {hint_key: dict(hint_info) for hint_key, hint_info in hint_data.items()}
+    for hint_key, ratio in zip(result.hint_keys, result.log_ratios):
+        hint_info = calibrated[hint_key]
+        multipliers = np.array(hint_multipliers(hint_info))
+        exclude = float(multipliers[~value_settings(hint_info).astype(bool)][0])
+        hint_info["value_multiplier"] = float(f"{exclude * math.exp(ratio):.4g}")
+    return calibrated
+
+
+# --- ラベル付きのセッション ---
+def simulated_sessions(num_sessions, games, model, hint_rate=DEFAULT_HINT_RATE, seed=SEED):
+    """設定1〜6を同数ずつ混ぜた疑似セッションと、その設定（長さNの1〜6）"""
+    rng = np.random.default_rng(seed)
+    sizes = [len(part) for part in np.array_split(np.arange(num_sessions), 6)]
+    parts = [simulate_sessions(setting, size, games, rng, model=model, hint_rate=hint_rate)
+             for setting, size in enumerate(sizes, start=1)]
+    columns = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    return columns, np.repeat(np.arange(1, 7), sizes)
+
+
+def read_labeled_csv(path, setting_column=DEFAULT_SETTING_COLUMN, schema=None):
+    """設定の列があるCSV（1行 = 1セッション）を (入力キー → 配列, 設定の配列) にする"""
+    with open(path, newline="", encoding="utf-8-sig") as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None) or []
+        rows = list(reader)
+    if setting_column not in header:
+        raise ValueError(f"{path}: 設定の列がありません: {setting_column}")
+    schema = resolve_schema(schema, header)
+    setting_index = header.index(setting_column)
+    columns = {
+        input_key: to_counts([row[header.index(column)] if header.index(column) < len(row) else "" for row in rows])
+        for input_key, column in schema.items()
+    }
+    try:
+        settings = np.array([int(row[setting_index]) for row in rows], dtype=int)
+    except (ValueError, IndexError):
+        raise ValueError(f"{path}: {setting_column} の列は1〜6の整数で指定してください") from None
+    return columns, settings
+
+
+def format_result(result, hint_data, calibrated, counts):
+    lines = []
+    for index, hint_key in enumerate(result.hint_keys):
+        before, after = hint_data[hint_key].get("value_multiplier"), calibrated[hint_key]["value_multiplier"]
+        lines.append(f"  {hint_key}: value_multiplier {before:g} → {after:g}（{result.statuses[index]}、"
+                     f"出現 {counts.value_appearances[index]:g} / {counts.exclude_appearances[index]:g}回）")
+    return "\n".join(lines)
+
+
+def format_recovery_errors(errors):
+    return "\n".join(f"  {hint_key}: 対数比 {true_ratio:.3f} → {ratio:.3f}（許容幅 ±{limit:.3f}）"
+                     for hint_key, true_ratio, ratio, limit in errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="示唆の倍率をラベル付きのセッションから推定し、スペック表の新しい版を書き出す")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--labeled", help="設定が分かっているセッションのCSV（1行 = 1セッション）")
+    source.add_argument("--simulate", type=int, help="疑似セッションの件数（設定1〜6を同数ずつ）")
+    parser.add_argument("--setting-column", default=DEFAULT_SETTING_COLUMN, help="設定の列名（--labeled）")
+    parser.add_argument("--schema", help="入力キー → 列名 の対応表（JSON、--labeled）。省略時は列名＝入力キー")
+    parser.add_argument("--games", type=int, default=DEFAULT_CHECK_GAMES, help="疑似セッションのゲーム数（--simulate と書き出し前の確認）")
+    parser.add_argument("--hint-rate", type=float, default=DEFAULT_HINT_RATE, help="疑似セッションの示唆の出現率（--simulate と書き出し前の確認）")
+    parser.add_argument("--check-sessions", type=int, default=DEFAULT_CHECK_SESSIONS, help="書き出し前の確認に使う疑似セッションの件数（--labeled）")
+    parser.add_argument("--machine", default=DEFAULT_MACHINE)
+    parser.add_argument("--revision", type=int, help="元にするスペック表の版（省略時は最新）")
+    parser.add_argument("--new-revision", type=int, help="書き出す版（省略時は最新の次）")
+    parser.add_argument("--output-dir", help="書き出すディレクトリ（既定: specs/）")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_MIN_COUNT, help="推定に使う示唆の出現回数の下限（未満なら元の値のまま）")
+    parser.add_argument("--dry-run", action="store_true", help="推定結果を表示するだけで書き出さない")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.machine, args.revision)
+    model = compile_model(spec.game_data, spec.hint_data)
+    hint_keys, indicators = fittable_hints(spec.hint_data)
+    initial_ratios = log_ratios(spec.hint_data, hint_keys)
+    try:
+        if args.labeled:
+            columns, settings = read_labeled_csv(args.labeled, args.setting_column, load_schema(args.schema))
+        else:
+            columns, settings = simulated_sessions(args.simulate, args.games, model, args.hint_rate)
+        counts = prepare(columns, settings, hint_keys, indicators)
+    except ValueError as error:
+        parser.error(str(error))
+    if not (counts.value_appearances + counts.exclude_appearances).any():
+        sys.exit("示唆が出現したセッションがありません")
+
+    result = calibrate(counts, hint_keys, initial_ratios, args.min_count)
+    calibrated = calibrated_hint_data(spec.hint_data, result)
+    print(f"{len(settings)}件のセッションで推定しました", file=sys.stderr)
+    print(format_result(result, spec.hint_data, calibrated, counts))
+
+    # 元の倍率で作った疑似データから元の倍率を推定し直せなければ、推定の前提が崩れているので書き出さない
+    if args.simulate:
+        errors = recovery_errors(result, initial_ratios)
+    else:
+        errors = check_recovery(spec, args.check_sessions, args.games, args.hint_rate, args.min_count)
+    if errors:
+        print(f"疑似データから元の倍率を推定し直せませんでした:\n{format_recovery_errors(errors)}", file=sys.stderr)
+        if not args.dry_run:
+            sys.exit("スペック表は書き出しません")
+    if args.dry_run:
+        return
+
+    revision = args.new_revision or max(available_revisions(args.machine)) + 1
+    notes = (f"版{spec.revision}の示唆の倍率を{len(settings)}件のラベル付きセッションから推定した値"
+             f"（calibrate.py、{'疑似データ' if args.simulate else args.labeled}）。")
+    try:
+        path = write_spec(args.machine, revision, spec.game_data, calibrated, spec.name, notes, args.output_dir)
+    except SpecError as error:
+        sys.exit(str(error))
+    print(f"版{revision}を書き出しました: {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
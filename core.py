@@ -0,0 +1,634 @@
+"""
+東京喰種 スロット設定推測ツールの推測ロジック。
+Streamlitに依存しないので、バッチ処理やCLIからも import して使える。
+SciPyは初めて尤度を計算するときに読み込む（import を軽くするため）。
+スペック表は機種・版ごとのファイル（specs/）にあり、get_model で切り替えられる。
+"""
+import functools
+import math
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from spec_registry import DEFAULT_MACHINE, HINT_TYPES, compiled_cache_dir, load_spec, resolve_revision, spec_digest
+
+# --- 定義データ ---
+# スペック表は specs/<機種>/<版>.json にあり、spec_registry から読み込む（形式は spec_registry を参照）。
+# GAME_DATA / HINT_DATA は既定の機種の最新版
+DEFAULT_SPEC = load_spec(DEFAULT_MACHINE)
+GAME_DATA = DEFAULT_SPEC.game_data
+HINT_DATA = DEFAULT_SPEC.hint_data
+
+
+# --- 確率系の判別要素 ---
+# (GAME_DATAのキー, 観測回数の入力キー, 試行回数の入力キー, %形式かどうか)
+# 試行回数が0の要素は計算に影響を与えない
+PROBABILITY_FACTORS = [
+    ("AT初当り確率", "at_first_hit_count", "total_game_count", False),
+    ("CZ出現率トータル", "cz_total_count", "total_game_count", False),
+    ("CZ_レミニセンス当選率", "cz_rem_observed_count", "cz_rem_total_count", False),
+    ("CZ_大喰らいのリゼ当選率", "cz_rize_observed_count", "cz_rize_total_count", False),
+    ("弱チェリーCZ当選率_通常滞在時", "weak_cherry_cz_count_normal", "weak_cherry_count", True),
+    ("弱チェリーCZ当選率_高確滞在時", "weak_cherry_cz_count_high", "weak_cherry_count", True),
+    ("規定ゲーム数150G以内CZ当選率", "reg_game_150g_count", "reg_game_150g_total", True),
+    ("下段リプレイ出現率", "lower_replay_count", "total_game_count", False),
+    ("初当りエピソードボーナス当選率", "ep_bonus_count", "at_first_hit_count", False),
+    ("引き戻し（即前兆）確率", "pullback_success_count", "pullback_total_count", True),
+    ("裏AT当選率_初当り経由", "ura_at_success_count", "ura_at_total_count", True),
+]
+
+# --- 振り分け系の判別要素（カテゴリカル分布） ---
+# (要素名, 試行回数の入力キー（なければ None）, [(GAME_DATAのキー, 回数の入力キー), ...])
+# 1回ごとに、設定ごとの振り分け（GAME_DATAの各行、%形式）に従っていずれか1つのカテゴリーに入るものとして、
+# カテゴリーごとの回数を多項分布で計算する。振り分けは設定ごとに合計1になるよう正規化する。
+# 尤度はカテゴリーごとの回数だけで決まる（試行回数の入力キーは simulate で回数を生成するときに使う）
+CATEGORICAL_FACTORS = [
+    ("精神世界ステージ滞在G数", "mental_stage_total_count", [
+        ("精神世界ステージ滞在G数_10G", "mental_stage_10g_count"),
+        ("精神世界ステージ滞在G数_20G", "mental_stage_20g_count"),
+        ("精神世界ステージ滞在G数_30G", "mental_stage_30g_count"),
+    ]),
+    ("通常時モード比率", None, [
+        ("通常時モード比率_通常A", "mode_normal_a_count"),
+        ("通常時モード比率_通常B", "mode_normal_b_count"),
+        ("通常時モード比率_通常C", "mode_normal_c_count"),
+        ("通常時モード比率_チャンス", "mode_chance_count"),
+        ("通常時モード比率_天国準備", "mode_heaven_prep_count"),
+        ("通常時モード比率_天国", "mode_heaven_count"),
+    ]),
+]
+
+# predict_setting が使う入力キーの一覧（確率系の要素 → 振り分け系の要素 → 示唆系の順）
+INPUT_KEYS = list(dict.fromkeys(
+    [key for _, observed_key, total_key, _ in PROBABILITY_FACTORS for key in (observed_key, total_key)]
+    + [key for _, total_key, categories in CATEGORICAL_FACTORS
+       for key in ([total_key] if total_key else []) + [count_key for _, count_key in categories]]
+)) + list(HINT_DATA)
+
+# 示唆系の入力キー → 入力欄のkey（確率系の要素は入力キーと同じkey）。app.py の入力欄の復元と loadtest_app.py で使う
+HINT_WIDGET_KEYS = {
+    "CZ失敗時カード_鈴屋什造（赤枠）": "cz_fail_card_suzuki",
+    "CZ失敗時カード_泉（金枠）": "cz_fail_card_izumi",
+    "CZ失敗時カード_有馬貴将（虹枠）": "cz_fail_card_arima",
+    "滞納状況示唆_僕にはディナーでもどうだい？": "tainou_boku_dinner",
+    "滞納状況示唆_不思議な香りだ…（招待状：黒）": "tainou_fushigi_kaori",
+    "滞納状況示唆_君はなかなか": "tainou_kimi_nakanaka",
+    "滞納状況示唆_君はなかなか…（本を良いね）": "tainou_kimi_nakanaka_hon",
+    "滞納状況示唆_僕としたことだがな": "tainou_boku_shitakoto",
+    "滞納状況示唆_存分に": "tainou_zonbun",
+    "滞納状況示唆_特別な夜を過ごし": "tainou_tokubetsu_yoru",
+    "AT終了画面_金木研（通常）": "at_end_kinemoto",
+    "AT終了画面_旧多二福（月）": "at_end_futa",
+    "AT終了画面_アキラ（カネキ隣）": "at_end_akira",
+    "AT終了画面_ウタ（花）": "at_end_uta",
+    "AT終了画面_エト（集合）": "at_end_eto",
+    "AT終了画面_全員集合（アニメ2期最終話風）": "at_end_all_anime",
+    "AT終了画面_あんていく全員": "at_end_anteiku",
+    "エンディングカード_奇数設定示唆[弱]": "ending_card_kisu_w",
+    "エンディングカード_奇数設定示唆[強]": "ending_card_kisu_s",
+    "エンディングカード_偶数設定示唆[弱]": "ending_card_gusu_w",
+    "エンディングカード_偶数設定示唆[強]": "ending_card_gusu_s",
+    "エンディングカード_高設定示唆[弱]": "ending_card_kouset_w",
+    "エンディングカード_高設定示唆[強]": "ending_card_kouset_s",
+    "エンディングカード_設定1否定": "ending_card_1hitei",
+    "エンディングカード_設定2否定": "ending_card_2hitei",
+    "エンディングカード_設定3否定": "ending_card_3hitei",
+    "エンディングカード_設定4否定": "ending_card_4hitei",
+    "エンディングカード_設定5否定": "ending_card_5hitei",
+    "エンディングカード_設定3以上濃厚": "ending_card_3ijou",
+    "エンディングカード_設定4以上濃厚": "ending_card_4ijou",
+    "エンディングカード_設定5以上濃厚": "ending_card_5ijou",
+    "エンディングカード_設定6濃厚": "ending_card_6noukou",
+    "獲得枚数表示_456 OVER": "get_count_456",
+    "獲得枚数表示_666 OVER": "get_count_666",
+    "獲得枚数表示_1000-7 OVER": "get_count_1000_7",
+    "ナミちゃんトロフィー_銅（700Gで確認）": "nami_trophy_bronze",
+    "ナミちゃんトロフィー_銀": "nami_trophy_silver",
+    "ナミちゃんトロフィー_金": "nami_trophy_gold",
+    "ナミちゃんトロフィー_キリン": "nami_trophy_kirin",
+    "ナミちゃんトロフィー_虹": "nami_trophy_rainbow",
+}
+
+
+def per_trial_rate(target_rate_value, is_probability_rate):
+    """
+    解析値を1試行あたりの確率に変換する。
+    is_probability_rate: Trueなら%表示の小数をそのまま、Falseなら1/Xの分母Xから1/Xを返す。
+    """
+    if is_probability_rate:
+        return target_rate_value
+    if target_rate_value == float('inf'): # 分母無限大=確率0
+        return 0.0
+    return 1.0 / target_rate_value
+
+
+def compile_rate_table(game_data, game_key, is_probability_rate):
+    """スペック表の1行を、設定1〜6の (1試行あたりの確率, その対数) の配列にする。"""
+    rates = np.array([per_trial_rate(game_data[game_key][setting], is_probability_rate) for setting in range(1, 7)])
+    with np.errstate(divide="ignore"):
+        return rates, np.log(rates)
+
+
+def compile_factors(game_data):
+    """
+    要素ごとの確率・対数確率テーブルを作成する。
+    戻り値: (GAME_DATAのキー, 観測回数の入力キー, 試行回数の入力キー, 確率(6,), 対数確率(6,)) のリスト
+    """
+    missing = [game_key for game_key, _, _, _ in PROBABILITY_FACTORS if game_key not in game_data]
+    if missing:
+        raise ValueError(f"スペック表に必要な要素がありません: {', '.join(missing)}")
+    return [
+        (game_key, observed_key, total_key) + compile_rate_table(game_data, game_key, is_probability_rate)
+        for game_key, observed_key, total_key, is_probability_rate in PROBABILITY_FACTORS
+    ]
+
+
+def compile_categorical_factors(game_data):
+    """
+    振り分け系の要素ごとの確率・対数確率テーブルを作成する。
+    戻り値: (要素名, 試行回数の入力キー, 回数の入力キーのタプル, 確率(K, 6), 対数確率(K, 6)) のリスト
+    （K はカテゴリー数。確率は設定ごとに合計1に正規化する）
+    """
+    missing = [game_key for _, _, categories in CATEGORICAL_FACTORS for game_key, _ in categories if game_key not in game_data]
+    if missing:
+        raise ValueError(f"スペック表に必要な要素がありません: {', '.join(missing)}")
+    compiled = []
+    for name, total_key, categories in CATEGORICAL_FACTORS:
+        probabilities = np.array([[game_data[game_key][setting] for setting in range(1, 7)] for game_key, _ in categories], dtype=float)
+        if (probabilities < 0).any() or not (probabilities.sum(axis=0) > 0).all():
+            raise ValueError(f"{name}: 振り分けは0以上で、設定ごとの合計が正の値になるように指定してください")
+        probabilities /= probabilities.sum(axis=0)
+        with np.errstate(divide="ignore"):
+            log_probabilities = np.log(probabilities)
+        compiled.append((name, total_key, tuple(count_key for _, count_key in categories), probabilities, log_probabilities))
+    return compiled
+
+
+def hint_multipliers(hint_info):
+    """
+    示唆1回あたりの各設定(1〜6)への倍率をリストで返す。
+    """
+    hint_type = hint_info["type"]
+    if hint_type not in HINT_TYPES:
+        raise ValueError(f"未知の示唆タイプです: {hint_type}")
+    multipliers = []
+    for setting in range(1, 7):
+        multiplier = 1.0 # その示唆によって尤度を増減させる倍率
+
+        if hint_type in ("even_settings", "odd_settings", "high_settings"): # 偶数/奇数/高設定示唆
+            if setting in hint_info["settings"]: # 示唆された設定なら強くする
+                multiplier = hint_info.get("value_multiplier", 1.0)
+            else: # それ以外の設定なら減らす
+                multiplier = hint_info.get("exclude_multiplier", 1e-3)
+        elif hint_type == "min_setting": # 設定X以上
+            if setting >= hint_info["setting"]: # X以上なら強くする
+                multiplier = hint_info.get("value_multiplier", 1.0)
+            else: # X未満なら減らす
+                multiplier = hint_info.get("exclude_multiplier", 1e-3)
+        elif hint_type == "exact_setting": # 設定X確定/濃厚
+            if setting == hint_info["setting"]: # その設定なら強くする
+                multiplier = hint_info.get("value_multiplier", 1.0)
+            else: # その設定以外ならほぼゼロにする
+                multiplier = hint_info.get("exclude_multiplier", 1e-10) # 非常に小さい値
+        elif hint_type == "exclude_setting": # 設定X否定
+            if setting == hint_info["setting"]: # 否定された設定ならほぼゼロにする
+                multiplier = hint_info.get("value_multiplier", 1e-10) # 否定のmultiplierとして使用
+            else: # 否定された設定以外なら尤度を維持
+                multiplier = hint_info.get("exclude_multiplier", 1.0) # 尤度を維持する倍率
+        # normal: 特になし、尤度変更なし
+
+        multipliers.append(multiplier)
+    return multipliers
+
+
+def compile_hint_matrix(hint_data):
+    """
+    示唆データを (示唆キーのリスト, 形状(示唆数, 6)の対数倍率行列) にする。
+    出現回数ベクトル × 行列 で示唆による対数尤度の増減がまとめて求まる。
+    """
+    hint_keys = list(hint_data)
+    multiplier_rows = []
+    for hint_key in hint_keys:
+        try:
+            multipliers = hint_multipliers(hint_data[hint_key])
+        except ValueError as error:
+            raise ValueError(f"{hint_key}: {error}") from None
+        if min(multipliers) <= 0:
+            raise ValueError(f"{hint_key}: 倍率は正の値で指定してください")
+        multiplier_rows.append(multipliers)
+    return hint_keys, np.log(np.array(multiplier_rows).reshape(len(hint_keys), 6))
+
+
+# コンパイル済みのスペック表
+# factors: compile_factors の戻り値、hint_keys / hint_log_multipliers: compile_hint_matrix の戻り値、
+# categorical_factors: compile_categorical_factors の戻り値
+CompiledModel = namedtuple("CompiledModel", ["factors", "hint_keys", "hint_log_multipliers", "categorical_factors"])
+
+
+def compile_model(game_data=GAME_DATA, hint_data=HINT_DATA):
+    """スペック表（GAME_DATA / HINT_DATA と同じ形式）を推測用の配列にまとめる。"""
+    return CompiledModel(compile_factors(game_data), *compile_hint_matrix(hint_data), compile_categorical_factors(game_data))
+
+
+# 起動時に一度だけ作成する既定のスペック表
+DEFAULT_MODEL = compile_model()
+COMPILED_FACTORS, HINT_KEYS, HINT_LOG_MULTIPLIERS, COMPILED_CATEGORICAL_FACTORS = DEFAULT_MODEL
+
+# コンパイル済みキャッシュの形式（CompiledModel の配列の持ち方を変えたら上げる）
+COMPILED_CACHE_FORMAT = 2
+
+
+def save_compiled_model(model, path):
+    """CompiledModel を .npz に保存する（途中で止まっても壊れたファイルが残らないよう、書いてから置き換える）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+    game_keys, observed_keys, total_keys, rates, log_rates = zip(*model.factors)
+    # 振り分け系の要素はカテゴリー数が要素ごとに違うので、カテゴリーを縦に並べ、何番目の要素かを別に持つ
+    names, categorical_total_keys, count_keys, probabilities, log_probabilities = zip(*model.categorical_factors)
+    np.savez(
+        temporary_path, format=COMPILED_CACHE_FORMAT,
+        game_keys=np.array(game_keys), observed_keys=np.array(observed_keys), total_keys=np.array(total_keys),
+        rates=np.array(rates), log_rates=np.array(log_rates),
+        hint_keys=np.array(model.hint_keys, dtype=str), hint_log_multipliers=model.hint_log_multipliers,
+        categorical_names=np.array(names), categorical_total_keys=np.array([key or "" for key in categorical_total_keys]),
+        categorical_groups=np.repeat(np.arange(len(names)), [len(keys) for keys in count_keys]),
+        categorical_count_keys=np.concatenate(count_keys),
+        categorical_probabilities=np.vstack(probabilities), categorical_log_probabilities=np.vstack(log_probabilities),
+    )
+    os.replace(temporary_path, path)
+
+
+def load_compiled_model(path):
+    """save_compiled_model で保存した CompiledModel を読み込む（形式が違えば None）"""
+    with np.load(path, allow_pickle=False) as arrays:
+        if int(arrays["format"]) != COMPILED_CACHE_FORMAT:
+            return None
+        rates, log_rates = arrays["rates"], arrays["log_rates"]
+        factors = [
+            (str(game_key), str(observed_key), str(total_key), rates[index], log_rates[index])
+            for index, (game_key, observed_key, total_key)
+            in enumerate(zip(arrays["game_keys"], arrays["observed_keys"], arrays["total_keys"]))
+        ]
+        groups = arrays["categorical_groups"]
+        categorical_factors = [
+            (str(name), str(total_key) or None, tuple(str(key) for key in arrays["categorical_count_keys"][groups == index]),
+             arrays["categorical_probabilities"][groups == index], arrays["categorical_log_probabilities"][groups == index])
+            for index, (name, total_key) in enumerate(zip(arrays["categorical_names"], arrays["categorical_total_keys"]))
+        ]
+        return CompiledModel(factors, [str(key) for key in arrays["hint_keys"]], arrays["hint_log_multipliers"], categorical_factors)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_model_revision(machine, revision):
+    if (machine, revision) == (DEFAULT_MACHINE, DEFAULT_SPEC.revision):
+        return DEFAULT_MODEL
+    path = compiled_cache_dir() / f"{machine}-{revision}-{spec_digest(machine, revision)[:16]}.npz"
+    try:
+        model = load_compiled_model(path)
+    except (OSError, ValueError, KeyError):
+        model = None
+    if model is None:
+        spec = load_spec(machine, revision)
+        model = compile_model(spec.game_data, spec.hint_data)
+        try:
+            save_compiled_model(model, path)
+        except OSError: # キャッシュに書けなくても推測はできる
+            pass
+    return model
+
+
+def get_model(machine=DEFAULT_MACHINE, revision=None):
+    """
+    (機種, 版) のコンパイル済みスペック表を返す（revision を省略すると最新の版）。
+    コンパイル結果はディスク（spec_registry.compiled_cache_dir）にも保存し、
+    次のプロセスからはスペック表のファイルを解釈せずに読み込む。キーはファイルの内容のハッシュ。
+    """
+    return _get_model_revision(machine, resolve_revision(machine, revision))
+
+
+# --- 計算の高速化 ---
+# log(k!) の表（k = 0〜LOG_FACTORIAL_TABLE_SIZE-1）。観測回数は小さい整数がほとんどなので、
+# 表を引くだけで済み、SciPy（gammaln）は大きな回数や小数のときだけ使う。
+LOG_FACTORIAL_TABLE_SIZE = 1024
+LOG_FACTORIAL_TABLE = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, LOG_FACTORIAL_TABLE_SIZE)))))
+_LOG_FACTORIAL_LIST = LOG_FACTORIAL_TABLE.tolist()
+
+# 1件ずつの推測で (観測回数, 試行回数, 確率) ごとの対数尤度を覚えておく件数
+LIKELIHOOD_CACHE_SIZE = 65536
+
+
+def log_factorial(count):
+    """log(count!)（小さい整数は表から引く）"""
+    if 0 <= count < LOG_FACTORIAL_TABLE_SIZE and count == int(count):
+        return _LOG_FACTORIAL_LIST[int(count)]
+    return math.lgamma(count + 1)
+
+
+def log_factorials(counts):
+    """log(k!) の配列版（全て表の範囲内の整数なら表から引く）"""
+    if counts.size and 0 <= counts.min() and counts.max() < LOG_FACTORIAL_TABLE_SIZE:
+        indices = counts.astype(np.intp)
+        if (indices == counts).all():
+            return LOG_FACTORIAL_TABLE[indices]
+    return _gammaln(counts + 1)
+
+
+@functools.lru_cache(maxsize=LIKELIHOOD_CACHE_SIZE)
+def _cached_log_poisson_pmf(observed_count, total_count, rate):
+    """試行回数 total_count、1試行あたりの確率 rate で observed_count 回観測する対数尤度（メモ化）"""
+    expected_value = total_count * rate
+    if expected_value <= 0: # 期待値0なら観測0で尤度1、観測1以上はありえない
+        return 0.0 if observed_count == 0 else float('-inf')
+
+    # log P(k; λ) = k·log(λ) - λ - log(k!)
+    return observed_count * math.log(expected_value) - expected_value - log_factorial(observed_count)
+
+
+def likelihood_cache_info():
+    """対数尤度のメモのヒット数・ミス数など（functools.lru_cache の cache_info）"""
+    return _cached_log_poisson_pmf.cache_info()
+
+
+def clear_likelihood_cache():
+    _cached_log_poisson_pmf.cache_clear()
+
+
+# --- 推測ロジック関数 ---
+def calculate_log_likelihood(observed_count, total_count, target_rate_value, is_probability_rate=True):
+    """
+    実測値と解析値から対数尤度を計算する（ポアソン分布の対数PMF）。
+    target_rate_value: 1/X形式の場合のX、または%形式の小数。
+    is_probability_rate: Trueなら確率（%表示の小数）、Falseなら分母（1/XのX）
+    解析値が0%なのに観測がある場合は -inf を返す。同じ組み合わせの計算結果はメモから返す。
+    """
+    if total_count <= 0: # 試行回数がゼロ以下なら計算に影響を与えない
+        return 0.0
+    return _cached_log_poisson_pmf(observed_count, total_count, per_trial_rate(target_rate_value, is_probability_rate))
+
+
+def calculate_likelihood(observed_count, total_count, target_rate_value, is_probability_rate=True):
+    """
+    実測値と解析値から尤度を計算する。
+    target_rate_value: 1/X形式の場合のX、または%形式の小数。
+    is_probability_rate: Trueなら確率（%表示の小数）、Falseなら分母（1/XのX）
+    """
+    return math.exp(calculate_log_likelihood(observed_count, total_count, target_rate_value, is_probability_rate))
+
+
+def _gammaln(values):
+    """scipy.special.gammaln の遅延読み込み版"""
+    from scipy.special import gammaln
+    return gammaln(values)
+
+
+def warm_up():
+    """遅延読み込みしているSciPyを先に読み込む（初回の推測が遅くならないように）"""
+    _gammaln(1.0)
+
+
+def log_poisson_pmf(observed, total, rates, log_rates):
+    """
+    ポアソン分布の対数PMFをまとめて計算する。
+    observed, total: 形状(N, 1)、rates, log_rates: 形状(6,) → 形状(N, 6)の対数尤度を返す。
+    期待値 λ = total·rate、log λ = log(total) + log(rate) として閉じた形で計算する（log(k!) は表または gammaln）。
+    試行回数が0以下の行は0（影響なし）になる。
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_expected = np.log(total) + log_rates
+        # 観測0の場合は k·log(λ) の項を0とする（λ=0 でも NaN にしない）
+        log_likelihood = np.where(observed > 0, observed * log_expected, 0.0) - total * rates - log_factorials(observed)
+    return np.where(total > 0, log_likelihood, 0.0)
+
+
+def log_multinomial_pmf(counts, log_probabilities):
+    """
+    多項分布の対数PMFを全設定まとめて計算する。
+    counts: 形状(N, K)のカテゴリーごとの回数、log_probabilities: 形状(K, 6)の各設定の振り分けの対数 → 形状(N, 6)
+    log P = log(n!) - Σ log(k_i!) + Σ k_i·log(p_i)（n = Σ k_i）。設定によって変わる項は行列積1回で求まる。
+    振り分けが0のカテゴリーに回数がある設定は -inf になる。
+    """
+    impossible = np.isneginf(log_probabilities)
+    log_likelihood = counts @ np.where(impossible, 0.0, log_probabilities)
+    log_likelihood += (log_factorials(counts.sum(axis=1)) - log_factorials(counts).sum(axis=1))[:, np.newaxis]
+    if impossible.any():
+        log_likelihood[(counts > 0).astype(float) @ impossible > 0] = -np.inf
+    return log_likelihood
+
+
+class LikelihoodTrace:
+    """
+    要素ごとの計算時間と、各設定の対数尤度への寄与を記録する。
+    log_likelihood_matrix / predict_setting の trace 引数に渡して使う。
+    一括推測では全レコードの合計を持つので、複数回分を merge でまとめて集計できる。
+    """
+
+    def __init__(self):
+        self.seconds = {} # 要素名 → 計算時間の合計（秒）
+        self.log_likelihoods = {} # 要素名 → 形状(6,)の対数尤度の寄与の合計
+        self.active_records = {} # 要素名 → 寄与があったレコード数
+        self.num_records = 0
+
+    def record(self, name, seconds, contribution):
+        """要素 name の計算時間と、形状(N, 6)の対数尤度の寄与を記録する"""
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.log_likelihoods[name] = self.log_likelihoods.get(name, np.zeros(6)) + contribution.sum(axis=0)
+        self.active_records[name] = self.active_records.get(name, 0) + int(np.any(contribution != 0, axis=1).sum())
+
+    def merge(self, other):
+        """別の記録を足し合わせる"""
+        for name in other.seconds:
+            self.seconds[name] = self.seconds.get(name, 0.0) + other.seconds[name]
+            self.log_likelihoods[name] = self.log_likelihoods.get(name, np.zeros(6)) + other.log_likelihoods[name]
+            self.active_records[name] = self.active_records.get(name, 0) + other.active_records[name]
+        self.num_records += other.num_records
+        return self
+
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def to_rows(self, active_only=True):
+        """表示・集計用に、要素ごとの辞書のリストにする（active_only なら寄与のない要素を除く）"""
+        rows = []
+        for name, seconds in self.seconds.items():
+            if active_only and not self.active_records[name]:
+                continue
+            row = {"要素": name, "時間(µs)": seconds * 1e6, "レコード数": self.active_records[name]}
+            row.update({f"設定{setting}": float(value) for setting, value in enumerate(self.log_likelihoods[name], start=1)})
+            rows.append(row)
+        return rows
+
+
+def _single_record_factor_log_likelihoods(arrays, model):
+    """1件分の確率系要素の対数尤度（形状(6,)）を calculate_log_likelihood と同じメモを使って求める"""
+    log_likelihoods = [0.0] * 6
+    for _, observed_key, total_key, rates, _ in model.factors:
+        total = float(arrays[total_key][0, 0]) if total_key in arrays else 0.0
+        if total <= 0: # 試行回数がゼロ以下なら計算に影響を与えない
+            continue
+        observed = float(arrays[observed_key][0, 0]) if observed_key in arrays else 0.0
+        for column, rate in enumerate(rates.tolist()):
+            log_likelihoods[column] += _cached_log_poisson_pmf(observed, total, rate)
+    return np.array(log_likelihoods)
+
+
+def as_columns(data):
+    """
+    入力データを 入力キー → 値 の対応にする。
+    辞書はそのまま、構造化配列（records.RECORD_DTYPE など、フィールド名が入力キー）は各フィールドのビューにする。
+    """
+    if isinstance(data, (np.ndarray, np.void)) and data.dtype.names:
+        return {name: data[name] for name in data.dtype.names}
+    return data
+
+
+def log_likelihood_matrix(columns, model=None, trace=None):
+    """
+    入力データから各設定の対数尤度を計算する。
+    columns: 入力キー → 長さNの配列（足りないキーは0扱い）、または構造化配列（as_columns を参照）
+    model: compile_model の戻り値（省略時は DEFAULT_MODEL）
+    trace: LikelihoodTrace を渡すと、要素ごとの計算時間と寄与を記録する（省略時は記録しない）
+    戻り値: 形状(N, 6)の対数尤度（列は設定1〜6）
+    """
+    model = model or DEFAULT_MODEL
+    arrays = {key: np.asarray(value, dtype=float).reshape(-1, 1) for key, value in as_columns(columns).items()}
+    num_records = max((arr.shape[0] for arr in arrays.values()), default=0)
+    zeros = np.zeros((num_records, 1))
+    log_likelihoods = np.zeros((num_records, 6))
+
+    if trace is not None:
+        trace.num_records += num_records
+
+    # --- 確率系の要素の計算 ---
+    if num_records == 1 and trace is None:
+        # 1件だけのときは、メモ化したスカラー計算の方が配列演算より速い
+        log_likelihoods += _single_record_factor_log_likelihoods(arrays, model)
+    else:
+        for game_key, observed_key, total_key, rates, log_rates in model.factors:
+            observed = arrays.get(observed_key, zeros)
+            total = arrays.get(total_key, zeros)
+            if trace is None:
+                log_likelihoods += log_poisson_pmf(observed, total, rates, log_rates)
+            else:
+                start = time.perf_counter()
+                contribution = log_poisson_pmf(observed, total, rates, log_rates)
+                trace.record(game_key, time.perf_counter() - start, contribution)
+                log_likelihoods += contribution
+
+    # --- 振り分け系の要素の計算 ---
+    for name, _, count_keys, _, log_probabilities in model.categorical_factors:
+        if trace is None:
+            # 回数が全て0なら寄与は0（未入力の要素の行列を作らない）
+            if any(key in arrays and arrays[key].any() for key in count_keys):
+                counts = np.hstack([arrays.get(key, zeros) for key in count_keys])
+                log_likelihoods += log_multinomial_pmf(counts, log_probabilities)
+        elif any(key in arrays for key in count_keys):
+            counts = np.hstack([arrays.get(key, zeros) for key in count_keys])
+            start = time.perf_counter()
+            contribution = log_multinomial_pmf(counts, log_probabilities)
+            trace.record(name, time.perf_counter() - start, contribution)
+            log_likelihoods += contribution
+
+    # --- 示唆系の要素の計算 ---
+    # 1回出たら log(倍率)、2回出たら 2·log(倍率) と積算（出現回数行列 × 対数倍率行列）
+    if trace is not None:
+        # 記録するときは示唆ごとに分けて計算する
+        for index, hint_key in enumerate(model.hint_keys):
+            if hint_key in arrays:
+                start = time.perf_counter()
+                contribution = arrays[hint_key] * model.hint_log_multipliers[index]
+                trace.record(hint_key, time.perf_counter() - start, contribution)
+                log_likelihoods += contribution
+        return log_likelihoods
+
+    hint_counts = np.zeros((num_records, len(model.hint_keys)))
+    for index, hint_key in enumerate(model.hint_keys):
+        if hint_key in arrays:
+            hint_counts[:, index] = arrays[hint_key][:, 0]
+    log_likelihoods += hint_counts @ model.hint_log_multipliers
+
+    return log_likelihoods
+
+
+def normalize_log_likelihoods(log_likelihoods):
+    """
+    対数尤度を事後確率に正規化する（各行の合計が1）。
+    全ての設定の尤度がゼロ（-inf）の行はNaNになる。
+    """
+    max_log = log_likelihoods.max(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        likelihoods = np.exp(log_likelihoods - max_log)
+        return likelihoods / likelihoods.sum(axis=1, keepdims=True)
+
+
+def has_any_data(columns):
+    """各行に0より大きい数値入力が1つでもあるかを返す（形状(N,)）"""
+    arrays = [np.asarray(value, dtype=float).reshape(-1) for value in as_columns(columns).values()]
+    num_records = max((arr.shape[0] for arr in arrays), default=0)
+    any_data_entered = np.zeros(num_records, dtype=bool)
+    for arr in arrays:
+        any_data_entered |= arr > 0
+    return any_data_entered
+
+
+def log_prior(prior):
+    """設定1〜6の事前確率（合計が1でなくてもよい）を、尤度に足す対数（形状(6,)）にする。None なら均等"""
+    if prior is None:
+        return np.zeros(6)
+    prior = np.asarray(prior, dtype=float).reshape(6)
+    if (prior < 0).any() or not prior.sum() > 0:
+        raise ValueError("事前確率は0以上で、合計が正の値になるように指定してください")
+    with np.errstate(divide="ignore"):
+        return np.log(prior / prior.sum())
+
+
+def predict_setting(data_inputs, model=None, trace=None, prior=None):
+    # trace: LikelihoodTrace を渡すと要素ごとの計算時間と寄与を記録する
+    # prior: 設定1〜6の事前確率（省略時は均等。hall_prior.fit_hall_prior で求めた店舗の分布など）
+    # データが一つも入力されていない場合のチェック
+    if isinstance(data_inputs, np.ndarray) and data_inputs.dtype.names and data_inputs.size == 1:
+        data_inputs = data_inputs.reshape(-1)[0] # 構造化配列は1件分（長さ1の配列）も受け付ける
+    numeric_inputs = {key: value for key, value in as_columns(data_inputs).items() if isinstance(value, (int, float, np.number))}
+    if not has_any_data(numeric_inputs).any():
+        return "データが入力されていません。推測を行うには、少なくとも1つの判別要素を入力してください。"
+
+    # 各設定の総合対数尤度（対数空間で積算するのでアンダーフローしない）
+    log_likelihoods = log_likelihood_matrix(numeric_inputs, model, trace) + log_prior(prior)
+    if np.isneginf(log_likelihoods).all(): # 全ての尤度がゼロの場合
+        # 全設定がゼロの場合は、エラーまたは均等割り振り（今回はエラー表示）
+        return "データが不足しているか、矛盾しているため、推測が困難です。入力値を見直してください。"
+
+    # --- 最終結果の処理 ---
+    # 尤度を確率に正規化（合計が100%になるようにする）
+    posteriors = normalize_log_likelihoods(log_likelihoods)[0]
+    normalized_probabilities = {setting: posteriors[setting - 1] * 100 for setting in range(1, 7)}
+
+    # 最も確率の高い設定を見つける
+    predicted_setting = max(normalized_probabilities, key=normalized_probabilities.get)
+    max_prob_value = normalized_probabilities[predicted_setting]
+
+    # 結果を整形して返す
+    result_str = f"## ✨ 推測される設定: 設定{predicted_setting} (確率: 約{max_prob_value:.2f}%) ✨\n\n"
+    result_str += "--- 各設定の推測確率 ---\n"
+    # 確率が高い順にソートして表示
+    for setting, prob in sorted(normalized_probabilities.items(), key=lambda item: item[1], reverse=True):
+        result_str += f"  - 設定{setting}: 約{prob:.2f}%\n"
+
+    return result_str
+
+
+# --- 一括推測（ホール全台評価用） ---
+def predict_setting_batch(columns, model=None, trace=None, prior=None):
+    """
+    複数台のデータをまとめて推測する。
+    columns: predict_setting の入力キー → 長さNの配列（足りないキーは0扱い）、または構造化配列（records を参照）
+    戻り値: 形状(N, 6)の事後確率（各行の合計が1、列は設定1〜6）。
+    データ未入力の行、尤度が全てゼロになった行はNaNになる。
+    model: compile_model の戻り値（省略時は DEFAULT_MODEL）
+    trace: LikelihoodTrace を渡すと要素ごとの計算時間と寄与を記録する
+    prior: 設定1〜6の事前確率（省略時は均等）
+    """
+    posteriors = normalize_log_likelihoods(log_likelihood_matrix(columns, model, trace) + log_prior(prior))
+    posteriors[~has_any_data(columns)] = np.nan
+    return posteriors
@@ -0,0 +1,472 @@
+"""
+データカウンターの配信（台ごとのゲーム数・CZ・ATなどの回数の増分）を受け取り、
+全台の事後確率を更新し続ける常駐プロセス。
+
+    python counter_feed.py serve --port 8770 --websocket-port 8771
+    python counter_feed.py publish --port 8770 --machines 2000 --rate 5      # 疑似データカウンター
+    python counter_feed.py demo --machines 2000 --duration 10               # 両方を1プロセスで動かして計測
+
+配信は1行1件のJSON（TCP）、または1メッセージ1件のJSON（WebSocket、websockets が必要）。
+    {"machine": "A-101", "counts": {"total_game_count": 50, "cz_total_count": 1}}   # 回数の増分（入力キー → 回数）
+    {"command": "snapshot"}   # 応答: {"machines": {台: 事後確率}, "stats": {...}}（1行のJSON）
+
+受信したイベントは上限付きのキューを通して台ごとの集計値（predict_setting の入力と同じ回数 = 十分統計量）に足し、
+事後確率の計算はイベントごとには行わない。変化のあった台だけを、最短 interval-ms ごとに1回の
+predict_setting_batch でまとめて計算し直す。キューが一杯になると受信側は読み込みを止めるので、
+配信元にはTCPのフロー制御で待ってもらうことになり、メモリは増え続けない。
+"""
+import argparse
+import asyncio
+import collections
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core import INPUT_KEYS, predict_setting_batch, warm_up
+from simulate import simulate_sessions
+
+DEFAULT_PORT = 8770
+DEFAULT_INTERVAL_MS = 200.0 # 事後確率をまとめて計算し直す最短の間隔
+DEFAULT_QUEUE_SIZE = 10_000 # 受信して未反映のイベントの上限（超えると受信を止める）
+DEFAULT_APPLY_BATCH = 1_000 # キューから一度に取り出して反映するイベント数
+MAX_LINE_BYTES = 1024 * 1024
+MAX_EVENT_COUNT = 1_000_000 # 1件のイベントの回数の増分の上限（1台1日のゲーム数より十分大きい値）
+HEARTBEAT_SECONDS = 0.05 # イベントループの遅れを測る間隔
+LATENCY_SAMPLES = 10_000 # 遅れ・待ち時間の統計に使う直近のサンプル数
+SEED = 0
+
+# 疑似データカウンターの既定値
+DEFAULT_MACHINES = 2000
+DEFAULT_CONNECTIONS = 50
+DEFAULT_RATE = 5.0 # 1台あたり毎秒のイベント数
+DEFAULT_GAMES_PER_EVENT = 10 # 1イベントで進むゲーム数
+
+_INPUT_COLUMNS = {key: column for column, key in enumerate(INPUT_KEYS)}
+
+
+class FeedError(ValueError):
+    """配信の1件の内容が不正"""
+
+
+def parse_event(message):
+    """
+    1件のJSON（文字列 / バイト列）を ("event", 台, 列番号の配列, 回数の配列) または ("command", 名前) にする。
+    不正な内容は FeedError にする。
+    """
+    try:
+        event = json.loads(message)
+    except ValueError:
+        raise FeedError("JSONとして読み込めません") from None
+    if not isinstance(event, dict):
+        raise FeedError("各イベントはJSONオブジェクトで指定してください")
+    if "command" in event:
+        return "command", event["command"]
+    machine, counts = event.get("machine"), event.get("counts")
+    if not isinstance(machine, (str, int)) or isinstance(machine, bool) or not isinstance(counts, dict):
+        raise FeedError('{"machine": 台, "counts": {入力キー: 回数}} の形式で指定してください')
+    unknown = [key for key in counts if key not in _INPUT_COLUMNS]
+    if unknown:
+        raise FeedError(f"未知の入力キーです: {', '.join(unknown)}")
+    values = list(counts.values())
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+               and 0 <= value <= MAX_EVENT_COUNT for value in values):
+        raise FeedError(f"回数は0〜{MAX_EVENT_COUNT}の数値で指定してください")
+    return "event", str(machine), [_INPUT_COLUMNS[key] for key in counts], values
+
+
+class MachineTable:
+    """
+    台ごとの集計値（形状(台数, 入力キー数)）と事後確率（形状(台数, 6)）。
+    台は最初のイベントで追加し、配列は足りなくなったら倍に広げる。
+    """
+
+    def __init__(self, capacity=1024):
+        self.rows = {} # 台 → 行番号
+        self.machines = [] # 行番号 → 台
+        self.counts = np.zeros((capacity, len(INPUT_KEYS)))
+        self.posteriors = np.full((capacity, 6), np.nan)
+        self.dirty_since = np.full(capacity, np.nan) # 最後に計算し直してから最初に変化した時刻（変化なしはNaN）
+        self.dirty = set()
+        self.changed = asyncio.Event()
+
+    def row(self, machine):
+        row = self.rows.get(machine)
+        if row is None:
+            row = self.rows[machine] = len(self.machines)
+            self.machines.append(machine)
+            if row >= len(self.counts):
+                self._grow(2 * len(self.counts))
+        return row
+
+    def _grow(self, capacity):
+        extra = capacity - len(self.counts)
+        self.counts = np.vstack([self.counts, np.zeros((extra, self.counts.shape[1]))])
+        self.posteriors = np.vstack([self.posteriors, np.full((extra, 6), np.nan)])
+        self.dirty_since = np.concatenate([self.dirty_since, np.full(extra, np.nan)])
+
+    def add(self, machine, columns, values, now):
+        row = self.row(machine)
+        self.counts[row, columns] += values
+        if row not in self.dirty:
+            self.dirty.add(row)
+            self.dirty_since[row] = now
+        self.changed.set()
+
+    def take_dirty(self):
+        """変化のあった行と、その集計値のコピーを取り出す（取り出した行は変化なしに戻す）"""
+        rows = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+        self.dirty = set()
+        self.changed.clear()
+        oldest = float(np.min(self.dirty_since[rows])) if len(rows) else None
+        self.dirty_since[rows] = np.nan
+        return rows, self.counts[rows], oldest
+
+    def snapshot(self):
+        """台 → 事後確率のリスト（まだ計算していない台は None）"""
+        return {
+            machine: None if np.isnan(posterior).any() else posterior.tolist()
+            for machine, posterior in zip(self.machines, self.posteriors)
+        }
+
+
+def predict_counts(counts):
+    """形状(N, 入力キー数)の集計値をまとめて推測する（ワーカースレッドで実行）"""
+    return predict_setting_batch({key: counts[:, column] for column, key in enumerate(INPUT_KEYS)})
+
+
+class FeedStats:
+    """受信・反映・再計算の件数と、遅れの統計"""
+
+    def __init__(self):
+        self.events_received = 0
+        self.events_applied = 0
+        self.rejected = 0
+        self.backpressure_waits = 0 # キューが一杯で受信側が待った回数
+        self.batches = 0
+        self.rows_recomputed = 0
+        self.max_queue_depth = 0
+        self.staleness = collections.deque(maxlen=LATENCY_SAMPLES) # 変化してから事後確率に反映されるまでの秒数
+        self.loop_lag = collections.deque(maxlen=LATENCY_SAMPLES) # イベントループの遅れ（秒）
+        self.started = time.monotonic()
+
+    def to_dict(self, queue_depth=0):
+        def percentiles(samples):
+            if not samples:
+                return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+            values = np.array(samples) * 1000
+            return {"p50_ms": float(np.percentile(values, 50)), "p99_ms": float(np.percentile(values, 99)),
+                    "max_ms": float(values.max())}
+
+        elapsed = time.monotonic() - self.started
+        return {
+            "events_received": self.events_received,
+            "events_applied": self.events_applied,
+            "events_per_second": self.events_applied / elapsed if elapsed > 0 else 0.0,
+            "rejected": self.rejected,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "backpressure_waits": self.backpressure_waits,
+            "batches": self.batches,
+            "rows_per_batch": self.rows_recomputed / self.batches if self.batches else 0.0,
+            "staleness": percentiles(self.staleness),
+            "loop_lag": percentiles(self.loop_lag),
+        }
+
+
+class FeedDaemon:
+    """
+    受信 → キュー → 集計値への反映 → まとめて再計算 の流れを管理する。
+    start でバックグラウンドのタスクを起動し、handle_tcp / handle_websocket を接続ごとのハンドラに使う。
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL_MS / 1000, queue_size=DEFAULT_QUEUE_SIZE,
+                 apply_batch=DEFAULT_APPLY_BATCH, executor=None):
+        self.table = MachineTable()
+        self.stats = FeedStats()
+        self.interval = interval
+        self.apply_batch = apply_batch
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, initializer=warm_up)
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(task) for task in (self._apply_loop(), self._recompute_loop(), self._heartbeat())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def flush(self):
+        """キューに残ったイベントを反映し、変化のあった台を計算し直す（計測・終了時用）"""
+        await self.queue.join()
+        await self._recompute()
+
+    # --- 受信 ---
+    async def receive(self, message):
+        """
+        1件を受け取る。イベントならキューに入れて None、コマンドなら応答のJSONオブジェクトを返す。
+        キューが一杯なら空くまで待つ（この間は接続からの読み込みも止まる）。
+        """
+        try:
+            parsed = parse_event(message)
+        except FeedError as error:
+            self.stats.rejected += 1
+            return {"error": str(error)}
+        if parsed[0] == "command":
+            if parsed[1] == "snapshot":
+                return {"machines": self.table.snapshot(), "stats": self.status()}
+            if parsed[1] == "stats":
+                return {"stats": self.status()}
+            return {"error": f"未知のコマンドです: {parsed[1]}"}
+        self.stats.events_received += 1
+        if self.queue.full():
+            self.stats.backpressure_waits += 1
+        await self.queue.put(parsed[1:])
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue.qsize())
+        return None
+
+    def status(self):
+        return {**self.stats.to_dict(self.queue.qsize()), "machines": len(self.table.machines)}
+
+    async def handle_tcp(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.receive(line)
+                if response is not None:
+                    writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                    await writer.drain()
+        except (ConnectionError, ValueError): # ValueError: 1行が MAX_LINE_BYTES を超えた
+            pass
+        finally:
+            writer.close()
+
+    async def handle_websocket(self, websocket):
+        import websockets
+        try:
+            async for message in websocket:
+                response = await self.receive(message)
+                if response is not None:
+                    await websocket.send(json.dumps(response, ensure_ascii=False))
+        except websockets.ConnectionClosed:
+            pass
+
+    # --- 反映と再計算 ---
+    async def _apply_loop(self):
+        while True:
+            events = [await self.queue.get()]
+            while len(events) < self.apply_batch and not self.queue.empty():
+                events.append(self.queue.get_nowait())
+            now = time.monotonic()
+            for machine, columns, values in events:
+                self.table.add(machine, columns, values, now)
+            self.stats.events_applied += len(events)
+            for _ in events:
+                self.queue.task_done()
+            await asyncio.sleep(0) # 受信側に順番を回す
+
+    async def _recompute_loop(self):
+        last = 0.0
+        while True:
+            await self.table.changed.wait()
+            # 前回から interval 秒たつまで待ち、その間の変化をまとめて1回で計算し直す
+            wait = last + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            last = time.monotonic()
+            await self._recompute()
+
+    async def _recompute(self):
+        rows, counts, oldest = self.table.take_dirty()
+        if not len(rows):
+            return
+        posteriors = await asyncio.get_running_loop().run_in_executor(self.executor, predict_counts, counts)
+        self.table.posteriors[rows] = posteriors
+        self.stats.batches += 1
+        self.stats.rows_recomputed += len(rows)
+        self.stats.staleness.append(time.monotonic() - oldest)
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            self.stats.loop_lag.append(time.monotonic() - start - HEARTBEAT_SECONDS)
+
+
+async def start_servers(daemon, host, port, websocket_port=None):
+    """TCP（と websocket_port があればWebSocket）の受信を始め、サーバーのリストを返す"""
+    servers = [await asyncio.start_server(daemon.handle_tcp, host, port, limit=MAX_LINE_BYTES)]
+    if websocket_port is not None:
+        try:
+            import websockets
+        except ImportError:
+            sys.exit("WebSocketでの受信には websockets が必要です（pip install websockets）")
+        servers.append(await websockets.serve(daemon.handle_websocket, host, websocket_port, max_size=MAX_LINE_BYTES))
+    return servers
+
+
+# --- 疑似データカウンター ---
+def simulated_machines(num_machines, seed=SEED):
+    """台の名前と真の設定（1〜6を一様に選ぶ）"""
+    rng = np.random.default_rng(seed)
+    return [f"M{index:04d}" for index in range(num_machines)], rng.integers(1, 7, num_machines)
+
+
+def simulated_events(machines, settings, games_per_event, rng):
+    """各台が games_per_event G進んだときのイベント（JSONの文字列）のリストを、設定ごとにまとめて生成する"""
+    events = [None] * len(machines)
+    for setting in range(1, 7):
+        indices = np.flatnonzero(settings == setting)
+        if not len(indices):
+            continue
+        columns = simulate_sessions(setting, len(indices), games_per_event, rng, hint_rate=0.0)
+        keys = list(columns)
+        values = np.column_stack([columns[key] for key in keys]).tolist()
+        for index, row in zip(indices.tolist(), values):
+            counts = {key: value for key, value in zip(keys, row) if value}
+            events[index] = json.dumps({"machine": machines[index], "counts": counts}, ensure_ascii=False)
+    return events
+
+
+async def publish(host, port, num_machines=DEFAULT_MACHINES, connections=DEFAULT_CONNECTIONS, rate=DEFAULT_RATE,
+                  games_per_event=DEFAULT_GAMES_PER_EVENT, duration=10.0, seed=SEED, websocket=False):
+    """
+    num_machines 台が1台あたり毎秒 rate 件のイベントを送り続ける疑似データカウンター。
+    台は connections 本の接続に分けて、各接続が担当の台のイベントを送る。送ったイベント数を返す。
+    受信側が止まっている間は送信も待つ（drain / send）。
+    """
+    machines, settings = simulated_machines(num_machines, seed)
+    deadline = time.monotonic() + duration
+    groups = np.array_split(np.arange(num_machines), max(1, min(connections, num_machines)))
+
+    async def run_connection(index, group):
+        rng = np.random.default_rng([seed, index])
+        group_machines = [machines[machine] for machine in group]
+        if websocket:
+            import websockets
+            connection = await websockets.connect(f"ws://{host}:{port}", max_size=MAX_LINE_BYTES)
+            send = connection.send
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+            async def send(message):
+                writer.write(message.encode("utf-8") + b"\n")
+                await writer.drain()
+        sent = 0
+        next_tick = time.monotonic() + rng.random() / rate # 接続ごとに開始をずらす
+        try:
+            while time.monotonic() < deadline:
+                for event in simulated_events(group_machines, settings[group], games_per_event, rng):
+                    await send(event)
+                sent += len(group)
+                next_tick += 1 / rate
+                await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+        finally:
+            if websocket:
+                await connection.close()
+            else:
+                writer.close()
+        return sent
+
+    return sum(await asyncio.gather(*(run_connection(index, group) for index, group in enumerate(groups))))
+
+
+async def demo(num_machines, connections, rate, games_per_event, duration, interval, queue_size, seed=SEED):
+    """受信と疑似データカウンターを同じプロセスで動かし、(送信数, 統計, 正解率) を返す"""
+    daemon = FeedDaemon(interval=interval, queue_size=queue_size)
+    daemon.start()
+    server, = await start_servers(daemon, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        sent = await publish("127.0.0.1", port, num_machines, connections, rate, games_per_event, duration, seed)
+        while daemon.stats.events_received < sent: # 送信済みで、まだ受信していないイベントを待つ
+            await asyncio.sleep(0.01)
+        await daemon.flush()
+    finally:
+        server.close()
+        await daemon.stop()
+    machines, settings = simulated_machines(num_machines, seed)
+    rows = [daemon.table.rows[machine] for machine in machines]
+    accuracy = float((daemon.table.posteriors[rows].argmax(axis=1) + 1 == settings).mean())
+    return sent, daemon.status(), accuracy
+
+
+async def serve(host, port, websocket_port, interval, queue_size, report_seconds):
+    daemon = FeedDaemon(interval=interval, queue_size=queue_size)
+    daemon.start()
+    servers = await start_servers(daemon, host, port, websocket_port)
+    addresses = ", ".join(str(sock.getsockname()) for server in servers for sock in server.sockets)
+    print(f"データカウンターの受信を開始しました: {addresses}", flush=True)
+    try:
+        while True:
+            await asyncio.sleep(report_seconds)
+            print(json.dumps(daemon.status(), ensure_ascii=False), file=sys.stderr, flush=True)
+    finally:
+        for server in servers:
+            server.close()
+        await daemon.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="データカウンターの配信を受け取り、全台の事後確率を更新し続ける")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_daemon_options(command_parser):
+        command_parser.add_argument("--interval-ms", type=float, default=DEFAULT_INTERVAL_MS, help="まとめて計算し直す最短の間隔（ミリ秒）")
+        command_parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="未反映のイベントの上限（超えると受信を止める）")
+
+    def add_publisher_options(command_parser):
+        command_parser.add_argument("--machines", type=int, default=DEFAULT_MACHINES, help="台数")
+        command_parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="接続数")
+        command_parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="1台あたり毎秒のイベント数")
+        command_parser.add_argument("--games-per-event", type=int, default=DEFAULT_GAMES_PER_EVENT, help="1イベントで進むゲーム数")
+        command_parser.add_argument("--duration", type=float, default=10.0, help="送信する秒数")
+        command_parser.add_argument("--seed", type=int, default=SEED)
+
+    serve_parser = commands.add_parser("serve", help="配信を受け取る")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP（1行1件のJSON）のポート")
+    serve_parser.add_argument("--websocket-port", type=int, help="WebSocketのポート（省略時はTCPのみ）")
+    serve_parser.add_argument("--report-seconds", type=float, default=10.0, help="統計を表示する間隔（秒）")
+    add_daemon_options(serve_parser)
+    publish_parser = commands.add_parser("publish", help="疑似データカウンターとして送信する")
+    publish_parser.add_argument("--host", default="127.0.0.1")
+    publish_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    publish_parser.add_argument("--websocket", action="store_true", help="WebSocketで送信する")
+    add_publisher_options(publish_parser)
+    demo_parser = commands.add_parser("demo", help="受信と疑似データカウンターを1プロセスで動かして計測する")
+    add_daemon_options(demo_parser)
+    add_publisher_options(demo_parser)
+    args = parser.parse_args(argv)
+    if args.command in ("serve", "demo") and (args.interval_ms < 0 or args.queue_size <= 0):
+        parser.error("--interval-ms は0以上、--queue-size は1以上で指定してください")
+
+    try:
+        if args.command == "serve":
+            warm_up()
+            asyncio.run(serve(args.host, args.port, args.websocket_port, args.interval_ms / 1000, args.queue_size,
+                              args.report_seconds))
+        elif args.command == "publish":
+            sent = asyncio.run(publish(args.host, args.port, args.machines, args.connections, args.rate,
+                                       args.games_per_event, args.duration, args.seed, args.websocket))
+            print(f"{sent}件を送信しました", file=sys.stderr)
+        else:
+            warm_up()
+            sent, status, accuracy = asyncio.run(demo(args.machines, args.connections, args.rate, args.games_per_event,
+                                                      args.duration, args.interval_ms / 1000, args.queue_size, args.seed))
+            print(json.dumps({"sent": sent, "accuracy": accuracy, **status}, ensure_ascii=False, indent=2))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+遊技中のイベント（1G消化、CZ当選、示唆出現など）を1件ずつ受け取り、
+設定推測をその場で更新する逐次推測器。
+集計値（predict_setting の入力と同じキー）と各要素の対数尤度を保持し、
+1イベントあたり定数時間で更新する。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from core import DEFAULT_MODEL, normalize_log_likelihoods
+
+# 精神世界ステージの滞在G数 → 入力キー
+MENTAL_STAGE_KEYS = {
+    10: "mental_stage_10g_count",
+    20: "mental_stage_20g_count",
+    30: "mental_stage_30g_count",
+}
+
+# 通常時モード → 入力キー
+NORMAL_MODE_KEYS = {
+    "通常A": "mode_normal_a_count",
+    "通常B": "mode_normal_b_count",
+    "通常C": "mode_normal_c_count",
+    "チャンス": "mode_chance_count",
+    "天国準備": "mode_heaven_prep_count",
+    "天国": "mode_heaven_count",
+}
+
+# snapshot / restore でやり取りする推測器の状態
+# counts: 入力キー → 回数、factor_log_likelihoods: 形状(要素数, 6)、hint_log_likelihood: 形状(6,)、
+# categorical_log_likelihood: 形状(6,)（振り分け系の要素の合計）
+EstimatorState = namedtuple("EstimatorState", ["counts", "factor_log_likelihoods", "hint_log_likelihood",
+                                               "categorical_log_likelihood"])
+
+
+class SettingEstimator:
+    """
+    1台分の逐次推測器。
+
+    各確率系要素の対数尤度は、設定によらない定数項（k·log(試行回数) と log(k!)）を除いた
+    k·log(確率) - 試行回数·確率 の形で持つ。振り分け系の要素も同様に Σ k_i·log(振り分け) だけを持つ。
+    定数項は正規化で消えるので、事後確率は predict_setting と一致する。
+    """
+
+    def __init__(self, model=None, inputs=None):
+        """
+        model: core.compile_model の戻り値（省略時は既定のスペック表）
+        inputs: 途中から始める場合の集計値（predict_setting の入力と同じ形式）
+        """
+        self.model = model or DEFAULT_MODEL
+        self.counts = {}
+        self.factor_log_likelihoods = np.zeros((len(self.model.factors), 6))
+        self.hint_log_likelihood = np.zeros(6)
+        self.categorical_log_likelihood = np.zeros(6)
+
+        # 入力キー → そのキーを観測回数/試行回数に使う要素の番号
+        self._factors_by_key = {}
+        for index, (_, observed_key, total_key, _, _) in enumerate(self.model.factors):
+            self._factors_by_key.setdefault(observed_key, []).append(index)
+            if total_key != observed_key:
+                self._factors_by_key.setdefault(total_key, []).append(index)
+        self._hint_rows = {hint_key: index for index, hint_key in enumerate(self.model.hint_keys)}
+        # 振り分け系のカテゴリーの入力キー → 形状(6,)の対数振り分け（1回ごとに足す）
+        self._category_log_probabilities = {
+            count_key: log_probabilities[index]
+            for _, _, count_keys, _, log_probabilities in self.model.categorical_factors
+            for index, count_key in enumerate(count_keys)
+        }
+
+        for key, value in (inputs or {}).items():
+            if isinstance(value, (int, float)) and value > 0:
+                self.add(key, value)
+
+    # --- イベント ---
+    def add(self, key, count=1):
+        """入力キー key の回数を count 増やし、関係する要素の対数尤度だけを更新する。"""
+        self.counts[key] = self.counts.get(key, 0) + count
+        for index in self._factors_by_key.get(key, ()):
+            self._update_factor(index)
+        if key in self._hint_rows:
+            self.hint_log_likelihood += count * self.model.hint_log_multipliers[self._hint_rows[key]]
+        if key in self._category_log_probabilities and count:
+            self.categorical_log_likelihood += count * self._category_log_probabilities[key]
+
+    def game(self, count=1):
+        """ゲームを count G消化した"""
+        self.add("total_game_count", count)
+
+    def cz(self):
+        """CZに当選した"""
+        self.add("cz_total_count")
+
+    def at_first_hit(self):
+        """ATに初当りした"""
+        self.add("at_first_hit_count")
+
+    def weak_cherry(self, cz_hit=False, high_state=False):
+        """
+        弱チェリーが成立した。
+        cz_hit: その弱チェリーでCZに当選したか、high_state: 高確滞在中だったか
+        """
+        self.add("weak_cherry_count")
+        if cz_hit:
+            self.add("weak_cherry_cz_count_high" if high_state else "weak_cherry_cz_count_normal")
+
+    def hint(self, hint_key):
+        """示唆（HINT_DATAのキー）が出現した"""
+        if hint_key not in self._hint_rows:
+            raise KeyError(f"未知の示唆です: {hint_key}")
+        self.add(hint_key)
+
+    def mental_stage_end(self, games):
+        """精神世界ステージが games G（10/20/30）で終了した"""
+        if games not in MENTAL_STAGE_KEYS:
+            raise ValueError(f"精神世界ステージの滞在G数は10/20/30のいずれかです: {games}")
+        self.add("mental_stage_total_count")
+        self.add(MENTAL_STAGE_KEYS[games])
+
+    def normal_mode(self, mode):
+        """通常時モード（通常A / 通常B / 通常C / チャンス / 天国準備 / 天国）が判明した"""
+        if mode not in NORMAL_MODE_KEYS:
+            raise ValueError(f"未知の通常時モードです: {mode}")
+        self.add(NORMAL_MODE_KEYS[mode])
+
+    # --- 推測結果 ---
+    def log_likelihood(self):
+        """各設定の対数尤度（定数項を除く、形状(6,)）"""
+        return self.factor_log_likelihoods.sum(axis=0) + self.hint_log_likelihood + self.categorical_log_likelihood
+
+    def posterior(self):
+        """各設定の事後確率（形状(6,)、合計1）。イベントがなければ均等になる。"""
+        return normalize_log_likelihoods(self.log_likelihood()[np.newaxis, :])[0]
+
+    def to_inputs(self):
+        """集計値を predict_setting の入力形式の辞書で返す"""
+        return dict(self.counts)
+
+    # --- 状態の保存と復元 ---
+    def snapshot(self):
+        """現在の状態を返す（restore で戻せる）"""
+        return EstimatorState(dict(self.counts), self.factor_log_likelihoods.copy(), self.hint_log_likelihood.copy(),
+                              self.categorical_log_likelihood.copy())
+
+    def restore(self, state):
+        """snapshot で保存した状態に戻す"""
+        self.counts = dict(state.counts)
+        self.factor_log_likelihoods = state.factor_log_likelihoods.copy()
+        self.hint_log_likelihood = state.hint_log_likelihood.copy()
+        self.categorical_log_likelihood = state.categorical_log_likelihood.copy()
+
+    def _update_factor(self, index):
+        """要素 index の対数尤度を現在の集計値から計算し直す"""
+        _, observed_key, total_key, rates, log_rates = self.model.factors[index]
+        observed = self.counts.get(observed_key, 0)
+        total = self.counts.get(total_key, 0)
+        if total <= 0: # 試行回数がゼロ以下なら計算に影響を与えない
+            self.factor_log_likelihoods[index] = 0.0
+        elif observed > 0:
+            self.factor_log_likelihoods[index] = observed * log_rates - total * rates
+        else:
+            self.factor_log_likelihoods[index] = -total * rates
@@ -0,0 +1,126 @@
+"""
+店舗・日ごとの設定配分（全台で共有する事前分布）をEMアルゴリズムで推定し、
+その事前分布を使った各台の事後確率をまとめて求める。
+
+イベント日のように設定の配分が均等でない日は、全台の尤度から配分を推定して事前分布にすると、
+台ごとの推測が店舗全体の傾向で補正される。EMの1反復は (台数, 6) の配列演算だけで済む。
+
+    python hall_prior.py 日次.csv 出力.csv --schema schema.json --group-columns 店舗 日付
+
+入力は ingest.py と同じ形式（1行 = 1台1日）。出力には事後確率の列（posterior_1〜6）を追加し、
+グループごとの推定配分を標準エラーに表示する。
+"""
+import argparse
+import csv
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from core import has_any_data, log_likelihood_matrix
+from ingest import POSTERIOR_COLUMNS, load_schema, resolve_schema, to_counts
+
+DEFAULT_MAX_ITERATIONS = 10_000
+DEFAULT_TOLERANCE = 1e-8
+# 事前分布の各設定に足す擬似的な台数（ディリクレ事前分布によるMAP推定）。
+# 台数が少ない日に、配分が0の設定が出て推測が極端になるのを防ぐ
+DEFAULT_PSEUDO_COUNT = 1.0
+
+# 推定結果
+# prior: 設定1〜6の推定配分（形状(6,)）、posteriors: prior を事前分布にした各台の事後確率（形状(N, 6)）、
+# iterations: 反復回数、converged: 収束したか、log_likelihood: 全台の対数周辺尤度
+HallPrior = namedtuple("HallPrior", ["prior", "posteriors", "iterations", "converged", "log_likelihood"])
+
+
+def fit_hall_prior(log_likelihoods, has_data=None, max_iterations=DEFAULT_MAX_ITERATIONS,
+                   tolerance=DEFAULT_TOLERANCE, pseudo_count=DEFAULT_PSEUDO_COUNT):
+    """
+    台ごとの対数尤度（形状(N, 6)、log_likelihood_matrix の戻り値）から、共有する設定配分を推定する。
+    has_data: 推定に使う台（形状(N,)の真偽値、省略時は全台）。データのない台の事後確率は配分そのものになる。
+    尤度が全てゼロ（矛盾）の台は推定から外し、事後確率はNaNになる。
+    """
+    log_likelihoods = np.asarray(log_likelihoods, dtype=float).reshape(-1, 6)
+    num_machines = log_likelihoods.shape[0]
+    has_data = np.ones(num_machines, dtype=bool) if has_data is None else np.asarray(has_data, dtype=bool)
+    max_log = log_likelihoods.max(axis=1, keepdims=True)
+    usable = has_data & np.isfinite(max_log[:, 0])
+
+    # 各台の尤度を行の最大値で割っておく（スケールは配分の推定に影響しない）
+    with np.errstate(invalid="ignore"):
+        likelihoods = np.exp(log_likelihoods[usable] - max_log[usable])
+    prior = np.full(6, 1 / 6)
+    iterations, converged, evidence = 0, False, np.ones(len(likelihoods))
+    for iterations in range(1, max_iterations + 1 if usable.any() else 1):
+        # E: 現在の配分での各台の事後確率、M: その平均（擬似台数を足す）を新しい配分にする
+        weighted = likelihoods * prior
+        evidence = weighted.sum(axis=1)
+        new_prior = (weighted.T @ (1 / evidence) + pseudo_count) / (len(likelihoods) + 6 * pseudo_count)
+        change = np.abs(new_prior - prior).max()
+        prior = new_prior
+        if change < tolerance:
+            converged = True
+            break
+
+    log_likelihood = float(np.log(likelihoods @ prior).sum() + max_log[usable].sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        joint = np.exp(log_likelihoods - max_log) * prior
+        posteriors = joint / joint.sum(axis=1, keepdims=True)
+    posteriors[~has_data] = prior
+    return HallPrior(prior, posteriors, iterations, converged, log_likelihood)
+
+
+def fit_hall_columns(columns, model=None, **options):
+    """
+    1店舗1日分の入力（入力キー → 長さNの配列）から配分と各台の事後確率を求める。
+    options は fit_hall_prior の引数。
+    """
+    return fit_hall_prior(log_likelihood_matrix(columns, model), has_any_data(columns), **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="店舗・日ごとの設定配分を推定し、各台の事後確率を補正する")
+    parser.add_argument("input", help="入力CSV（1行 = 1台1日）")
+    parser.add_argument("output", help="出力CSV")
+    parser.add_argument("--schema", help="入力キー → 列名 の対応表（JSON）。省略時は列名＝入力キー")
+    parser.add_argument("--group-columns", nargs="*", default=[], help="配分を共有する単位の列（例: 店舗 日付）。省略時はファイル全体")
+    parser.add_argument("--pseudo-count", type=float, default=DEFAULT_PSEUDO_COUNT, help="配分の各設定に足す擬似台数")
+    args = parser.parse_args(argv)
+
+    with open(args.input, newline="", encoding="utf-8-sig") as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None)
+        rows = list(reader)
+    if header is None:
+        sys.exit(f"{args.input}: 空のファイルです")
+    missing = [column for column in args.group_columns if column not in header]
+    if missing:
+        parser.error(f"列がありません: {', '.join(missing)}")
+    schema = resolve_schema(load_schema(args.schema), header)
+
+    groups = {}
+    group_indices = [header.index(column) for column in args.group_columns]
+    for row_index, row in enumerate(rows):
+        groups.setdefault(tuple(row[index] if index < len(row) else "" for index in group_indices), []).append(row_index)
+
+    posteriors = np.full((len(rows), 6), np.nan)
+    for group, row_indices in groups.items():
+        columns = {
+            input_key: to_counts([rows[row_index][header.index(column)] if header.index(column) < len(rows[row_index]) else ""
+                                  for row_index in row_indices])
+            for input_key, column in schema.items()
+        }
+        fitted = fit_hall_columns(columns, pseudo_count=args.pseudo_count)
+        posteriors[row_indices] = fitted.posteriors
+        label = " ".join(group) or "全体"
+        distribution = "  ".join(f"設定{setting} {share:.1%}" for setting, share in enumerate(fitted.prior, start=1))
+        note = "" if fitted.converged else "（収束せず）"
+        print(f"{label}: {len(row_indices)}台  {distribution}  反復{fitted.iterations}回{note}", file=sys.stderr)
+
+    with open(args.output, "w", newline="", encoding="utf-8") as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(header + POSTERIOR_COLUMNS)
+        writer.writerows(row + [f"{p:.6g}" for p in posterior] for row, posterior in zip(rows, posteriors))
+
+
+if __name__ == "__main__":
+    main()
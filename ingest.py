@@ -0,0 +1,168 @@
+"""
+データカウンターの書き出しファイル（CSV / Parquet、1行 = 1台1日）を一定行数ずつ読み込み、
+各行の設定1〜6の事後確率を列として追加して書き出すコマンド。
+
+    python ingest.py 入力.csv 出力.csv --schema schema.json --chunk-size 50000
+
+メモリに載るのは chunk-size 行分だけなので、数GBの月次アーカイブでも使用量は一定。
+Parquet の読み書きには pyarrow が必要（CSVだけなら不要）。
+"""
+import argparse
+import csv
+import json
+import sys
+import warnings
+
+import numpy as np
+
+from core import INPUT_KEYS, predict_setting_batch
+
+# 出力に追加する事後確率の列名（設定1〜6）
+POSTERIOR_COLUMNS = [f"posterior_{setting}" for setting in range(1, 7)]
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def load_schema(path):
+    """
+    列の対応表を読み込む。
+    JSONファイルの中身は {"入力キー": "ファイル側の列名", ...}。
+    path が None のときは、ファイル側の列名がそのまま入力キーになっているものとする。
+    """
+    if path is None:
+        return None
+    with open(path, encoding="utf-8") as schema_file:
+        schema = json.load(schema_file)
+    if not isinstance(schema, dict) or not all(isinstance(value, str) for value in schema.values()):
+        raise ValueError(f"{path}: スキーマは {{\"入力キー\": \"列名\"}} 形式のJSONで指定してください")
+    unknown = [key for key in schema if key not in INPUT_KEYS]
+    if unknown:
+        raise ValueError(f"{path}: 未知の入力キーです: {', '.join(unknown)}")
+    return schema
+
+
+def resolve_schema(schema, column_names):
+    """入力キー → 列名 の対応表を、実際にファイルにある列だけに絞って返す"""
+    if schema is None:
+        return {name: name for name in column_names if name in INPUT_KEYS}
+    missing = [column for column in schema.values() if column not in column_names]
+    if missing:
+        raise ValueError(f"スキーマの列がファイルにありません: {', '.join(missing)}")
+    return dict(schema)
+
+
+def to_counts(values):
+    """
+    列の値を数値配列にする（空欄や数値でない値は0扱い）。
+    負の値と無限大も0扱いにし、その件数を警告する（推測すると事後確率がNaNや極端な値になるため）。
+    """
+    try:
+        counts = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        counts = np.zeros(len(values))
+        for index, value in enumerate(values):
+            try:
+                counts[index] = float(value)
+            except (TypeError, ValueError):
+                pass
+    counts = np.nan_to_num(counts, nan=0.0, posinf=-1.0, neginf=-1.0)
+    invalid = counts < 0
+    if invalid.any():
+        warnings.warn(f"負の値または無限大が{int(invalid.sum())}件あったため0として扱いました", stacklevel=2)
+        counts[invalid] = 0.0
+    return counts
+
+
+def score_columns(columns, schema):
+    """列名 → 値の配列 から、形状(N, 6)の事後確率を求める"""
+    inputs = {input_key: to_counts(columns[column]) for input_key, column in schema.items()}
+    return predict_setting_batch(inputs)
+
+
+# --- CSV ---
+def ingest_csv(input_path, output_path, schema, chunk_size):
+    """CSVを chunk_size 行ずつ推測して書き出す。処理した行数を返す。"""
+    num_rows = 0
+    with open(input_path, newline="", encoding="utf-8-sig") as input_file, \
+            open(output_path, "w", newline="", encoding="utf-8") as output_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None)
+        if header is None:
+            return 0
+        schema = resolve_schema(schema, header)
+        column_indices = {column: header.index(column) for column in set(schema.values())}
+        writer = csv.writer(output_file)
+        writer.writerow(header + POSTERIOR_COLUMNS)
+
+        while True:
+            rows = [row for _, row in zip(range(chunk_size), reader)]
+            if not rows:
+                break
+            columns = {
+                column: [row[index] if index < len(row) else "" for row in rows]
+                for column, index in column_indices.items()
+            }
+            posteriors = score_columns(columns, schema)
+            writer.writerows(row + [f"{p:.6g}" for p in posterior] for row, posterior in zip(rows, posteriors))
+            num_rows += len(rows)
+    return num_rows
+
+
+# --- Parquet ---
+def import_pyarrow():
+    """(pyarrow, pyarrow.parquet) を返す（Parquetを扱うときだけ読み込む。なければ終了する）"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("Parquetの読み書きには pyarrow が必要です（pip install pyarrow）")
+    return pyarrow, pyarrow.parquet
+
+
+def ingest_parquet(input_path, output_path, schema, chunk_size):
+    """Parquetを chunk_size 行ずつ推測して書き出す。処理した行数を返す。"""
+    pa, pq = import_pyarrow()
+    parquet_file = pq.ParquetFile(input_path)
+    schema = resolve_schema(schema, parquet_file.schema_arrow.names)
+    num_rows = 0
+    writer = None
+    try:
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            columns = {column: batch.column(column).to_numpy(zero_copy_only=False) for column in set(schema.values())}
+            posteriors = score_columns(columns, schema)
+            arrays = batch.columns + [pa.array(posteriors[:, index]) for index in range(6)]
+            table = pa.Table.from_arrays(arrays, names=batch.schema.names + POSTERIOR_COLUMNS)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            num_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_rows
+
+
+def is_parquet(path):
+    return str(path).lower().endswith((".parquet", ".pq"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="データカウンターの書き出しファイルから設定の事後確率を計算する")
+    parser.add_argument("input", help="入力ファイル（.csv / .parquet）")
+    parser.add_argument("output", help="出力ファイル（入力と同じ形式）")
+    parser.add_argument("--schema", help="入力キー → 列名 の対応表（JSON）。省略時は列名＝入力キー")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help=f"一度に処理する行数（既定: {DEFAULT_CHUNK_SIZE}）")
+    args = parser.parse_args(argv)
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size は1以上で指定してください")
+    if is_parquet(args.input) != is_parquet(args.output):
+        parser.error("入力と出力は同じ形式（CSV同士 / Parquet同士）にしてください")
+
+    schema = load_schema(args.schema)
+    ingest = ingest_parquet if is_parquet(args.input) else ingest_csv
+    num_rows = ingest(args.input, args.output, schema, args.chunk_size)
+    print(f"{num_rows}行を処理しました: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
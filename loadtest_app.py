@@ -0,0 +1,238 @@
+"""
+Streamlitアプリ（app.py）の同時接続の負荷試験。
+
+ローカルで streamlit run app.py を起動し（--url を指定した場合は起動済みのサーバーに接続）、
+ブラウザと同じWebSocketのプロトコルで N セッションを同時に開いて、入力 → 「推測結果を表示」を繰り返す。
+再実行のレイテンシ（p50 / p99）と、サーバープロセスの1セッションあたりのメモリ増加量を表示する。
+
+    python loadtest_app.py --sessions 50 --reruns 10
+
+メモリの計測は /proc/<pid>/status を読むのでLinuxのみ（それ以外では省略）。
+"""
+import argparse
+import asyncio
+import json
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from core import HINT_WIDGET_KEYS
+from simulate import simulate_sessions
+
+ROOT = Path(__file__).resolve().parent
+SEED = 0
+STREAM_PATH = "/_stcore/stream"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    """streamlit run app.py をヘッドレスで起動し、(プロセス, URL) を返す"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(ROOT / "app.py"), "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Streamlitサーバーが起動しませんでした")
+
+
+def resident_memory(pid):
+    """プロセスの常駐メモリ（バイト）。取得できなければ None"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def make_inputs(count, seed=SEED):
+    """入力欄のkey → 値 の辞書を count 件作る（固定シードの疑似セッション。示唆系の入力キーは入力欄のkeyに変換する）"""
+    rng = np.random.default_rng(seed)
+    return [
+        {HINT_WIDGET_KEYS.get(key, key): int(values[0])
+         for key, values in simulate_sessions(index % 6 + 1, 1, int(rng.integers(500, 9000)), rng).items()}
+        for index in range(count)
+    ]
+
+
+class AppSession:
+    """WebSocketで接続した1セッション"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.number_inputs = {} # ウィジェットのkey → ウィジェットID
+        self.submit_button_id = None
+
+    async def rerun(self, widget_values=None, submit=False):
+        """スクリプトを再実行し、終了までの秒数を返す（widget_values: 入力欄のkey → 値。アプリにない入力欄は KeyError）"""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = ""
+        message.rerun_script.widget_states.SetInParent()
+        unknown = [key for key in widget_values or {} if key not in self.number_inputs]
+        if unknown:
+            raise KeyError(f"アプリにない入力欄です: {', '.join(unknown)}")
+        for key, value in (widget_values or {}).items():
+            state = message.rerun_script.widget_states.widgets.add()
+            state.id = self.number_inputs[key]
+            state.int_value = value
+        if submit and self.submit_button_id:
+            state = message.rerun_script.widget_states.widgets.add()
+            state.id = self.submit_button_id
+            state.trigger_value = True
+
+        start = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                self._collect_widget(forward.delta.new_element)
+            elif kind == "script_finished":
+                return time.perf_counter() - start
+
+    def _collect_widget(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "number_input":
+            key = element.number_input.id.rsplit("-", 1)[-1]
+            self.number_inputs[key] = element.number_input.id
+        elif kind == "button" and element.button.is_form_submitter:
+            self.submit_button_id = element.button.id
+
+
+async def connect(url):
+    return websockets.connect(url.replace("http", "ws", 1) + STREAM_PATH, subprotocols=["streamlit"], max_size=None)
+
+
+async def warm_up_server(url, inputs):
+    """スクリプトの初回実行（importやスペック表のコンパイル）をメモリ・時間の計測から外す"""
+    async with await connect(url) as websocket:
+        session = AppSession(websocket)
+        await session.rerun()
+        await session.rerun(inputs[0], submit=True)
+
+
+async def run_session(url, inputs, reruns, ready, release, latencies):
+    """1セッション: 接続 → 初回実行 → 全セッションの接続を待つ → reruns 回の入力と推測"""
+    async with await connect(url) as websocket:
+        session = AppSession(websocket)
+        await session.rerun()
+        ready.append(session)
+        await release.wait()
+        for index in range(reruns):
+            latencies.append(await session.rerun(inputs[index % len(inputs)], submit=True))
+        # 全セッションが終わるまで接続を保つ（メモリ計測のため）
+        ready.append(None)
+        await release.wait()
+
+
+async def run(url, pid, num_sessions, reruns, inputs):
+    latencies, ready = [], []
+    release = asyncio.Event()
+    await warm_up_server(url, inputs)
+    base_memory = resident_memory(pid) if pid else None
+
+    tasks = [
+        asyncio.create_task(run_session(url, inputs[index::num_sessions] or inputs, reruns, ready, release, latencies))
+        for index in range(num_sessions)
+    ]
+    while len(ready) < num_sessions:
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            if task.done() and task.exception():
+                raise task.exception()
+    release.set()
+    release.clear()
+    start = time.perf_counter()
+    while len(ready) < 2 * num_sessions:
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            if task.done() and task.exception():
+                raise task.exception()
+    elapsed = time.perf_counter() - start
+    loaded_memory = resident_memory(pid) if pid else None
+    release.set()
+    await asyncio.gather(*tasks)
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    summary = {
+        "sessions": num_sessions,
+        "reruns_per_session": reruns,
+        "reruns": len(latencies),
+        "elapsed_seconds": elapsed,
+        "reruns_per_second": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+    if base_memory is not None and loaded_memory is not None:
+        summary["server_memory_base_mb"] = base_memory / 2**20
+        summary["server_memory_loaded_mb"] = loaded_memory / 2**20
+        summary["memory_per_session_kb"] = (loaded_memory - base_memory) / num_sessions / 1024
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlitアプリの同時接続の負荷試験")
+    parser.add_argument("--sessions", type=int, default=20, help="同時に開くセッション数")
+    parser.add_argument("--reruns", type=int, default=10, help="1セッションあたりの「推測結果を表示」の回数")
+    parser.add_argument("--url", help="起動済みのサーバー（省略時はローカルで起動する）")
+    parser.add_argument("--pid", type=int, help="--url のサーバーのプロセスID（メモリ計測用）")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.pid
+    else:
+        process, url = start_server(free_port())
+        pid = process.pid
+    try:
+        inputs = make_inputs(max(args.sessions * args.reruns // 4, 1))
+        summary = asyncio.run(run(url, pid, args.sessions, args.reruns, inputs))
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    line = (f"{summary['sessions']}セッション × {summary['reruns_per_session']}回  "
+            f"p50 {summary['p50_ms']:.1f} ms  p99 {summary['p99_ms']:.1f} ms  {summary['reruns_per_second']:.1f} 回/秒")
+    if "memory_per_session_kb" in summary:
+        line += f"  メモリ {summary['memory_per_session_kb']:.0f} KB/セッション（サーバー {summary['server_memory_loaded_mb']:.0f} MB）"
+    print(line)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
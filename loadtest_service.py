@@ -0,0 +1,105 @@
+"""
+service.py の負荷試験。ローカルのサービスに同時接続で /predict を送り、
+レイテンシ（p50 / p99）と1秒あたりのリクエスト数を表示する。
+
+    python service.py --port 8765 &
+    python loadtest_service.py --port 8765 --requests 20000 --concurrency 64
+
+入力は固定シードで生成した疑似セッション（--unique 件を繰り返し使う）。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import numpy as np
+
+from simulate import simulate_sessions
+
+SEED = 0
+
+
+def make_payloads(count, seed=SEED):
+    """predict_setting の入力形式のレコードを count 件作り、JSONにエンコードして返す"""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for index in range(count):
+        columns = simulate_sessions(index % 6 + 1, 1, int(rng.integers(500, 9000)), rng)
+        record = {key: int(values[0]) for key, values in columns.items() if values[0] > 0}
+        payloads.append(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+    return payloads
+
+
+async def client(host, port, payloads, num_requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for index in range(num_requests):
+            body = payloads[index % len(payloads)]
+            request = (
+                f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode("latin-1") + body
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if b" 200 " not in status_line:
+                errors.append(status_line.decode("latin-1").strip())
+    finally:
+        writer.close()
+
+
+async def run(host, port, num_requests, concurrency, payloads):
+    latencies, errors = [], []
+    per_client = [num_requests // concurrency + (1 if index < num_requests % concurrency else 0) for index in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, payloads[index::concurrency] or payloads, count, latencies, errors)
+        for index, count in enumerate(per_client) if count
+    ))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="設定推測サービスの負荷試験")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=10_000, help="送信するリクエストの総数")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時接続数")
+    parser.add_argument("--unique", type=int, default=2_000, help="異なる入力の件数（少ないほどキャッシュが効く）")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+
+    payloads = make_payloads(args.unique)
+    latencies, errors, elapsed = asyncio.run(run(args.host, args.port, args.requests, args.concurrency, payloads))
+    quantiles = statistics.quantiles(latencies, n=100)
+    summary = {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+    print(f"{summary['requests']}件 / {elapsed:.2f}秒  {summary['requests_per_second']:.0f} req/s  "
+          f"p50 {summary['p50_ms']:.2f} ms  p99 {summary['p99_ms']:.2f} ms  エラー {summary['errors']}件")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+「あと何G回せば高設定と分かるか」の見積もり。
+
+現在の入力と事後確率から、真の設定を事後確率に従って選び、その設定のスペックで
+この先のゲームを疑似的に生成する（simulate.simulate_sessions）。候補のゲーム数（500G / 1000G / 2000G先など）
+ごとに、全シミュレーションをまとめて推測し、「設定k以上の確率」が閾値を超えている割合を求める。
+生成と推測はシミュレーション数ぶんの配列で一度に行うので、2000通りでも数十ミリ秒で終わる。
+
+    python planner.py --inputs '{"total_game_count": 3000, "at_first_hit_count": 12}' --min-setting 5 --threshold 0.9
+"""
+import argparse
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from core import DEFAULT_MODEL, as_columns, predict_setting_batch
+from simulate import simulate_sessions
+
+DEFAULT_HORIZONS = (500, 1000, 2000)
+DEFAULT_NUM_SIMULATIONS = 2000
+DEFAULT_MIN_SETTING = 5
+DEFAULT_THRESHOLD = 0.9
+SEED = 0
+# 示唆は出現率の解析値がなく、simulate の出現モデルは推測側の倍率と一致しないため、既定では生成しない
+# （生成すると事後確率の平均が現在の値からずれ、見積もりが楽観的になる）
+DEFAULT_HINT_RATE = 0.0
+
+# 見積もり結果
+# current_confidence: 現在の「設定 min_setting 以上」の確率
+# horizons: 候補のゲーム数ごとの HorizonEstimate のリスト
+PlanReport = namedtuple("PlanReport", ["min_setting", "threshold", "current_confidence", "horizons"])
+# games: あと何G回すか、crossing_probability: その時点で確率が閾値以上になっている割合、
+# mean_confidence: その時点の「設定 min_setting 以上」の確率の平均
+HorizonEstimate = namedtuple("HorizonEstimate", ["games", "crossing_probability", "mean_confidence"])
+
+
+def plan_games_to_confidence(inputs, posterior=None, horizons=DEFAULT_HORIZONS, min_setting=DEFAULT_MIN_SETTING,
+                             threshold=DEFAULT_THRESHOLD, num_simulations=DEFAULT_NUM_SIMULATIONS, seed=SEED,
+                             model=None, trial_rates=None, hint_rate=DEFAULT_HINT_RATE):
+    """
+    あと horizons G回したときに「設定 min_setting 以上の確率 ≥ threshold」になっている確率を見積もる。
+    inputs: 現在の入力（predict_setting と同じ辞書、または records の1件）
+    posterior: 現在の事後確率（省略時は inputs から計算。データがなければ均等）
+    trial_rates / hint_rate: simulate_sessions の引数（弱チェリー成立回数などの発生率、示唆の出現率。示唆は既定では生成しない）
+    同じ seed なら同じ結果になる。
+    """
+    if not 1 <= min_setting <= 6:
+        raise ValueError("min_setting は1〜6で指定してください")
+    model = model or DEFAULT_MODEL
+    rng = np.random.default_rng(seed)
+    current = {
+        key: float(np.asarray(value, dtype=float).reshape(-1)[0])
+        for key, value in as_columns(inputs).items() if isinstance(value, (int, float, np.number, np.ndarray))
+    }
+    if posterior is None and current:
+        posterior = predict_setting_batch({key: [value] for key, value in current.items()}, model)[0]
+    if posterior is None:
+        posterior = np.full(6, np.nan)
+    posterior = np.asarray(posterior, dtype=float)
+    if np.isnan(posterior).any():
+        posterior = np.full(6, 1 / 6)
+    posterior = posterior / posterior.sum()
+
+    # 真の設定を事後確率に従って選び、設定ごとに連続した範囲にまとめる（設定ごとに一括で生成するため）
+    settings_count = np.bincount(rng.choice(6, size=num_simulations, p=posterior), minlength=6)
+    bounds = np.concatenate(([0], np.cumsum(settings_count)))
+    cumulative = {key: np.full(num_simulations, value) for key, value in current.items()}
+
+    estimates = []
+    previous_games = 0
+    for games in sorted(horizons):
+        # 前の候補からの差分だけ生成して足す（同じシミュレーションの続きとして各候補を評価する）
+        for column, count in enumerate(settings_count):
+            if not count:
+                continue
+            future = simulate_sessions(column + 1, count, games - previous_games, rng, model=model,
+                                       trial_rates=trial_rates, hint_rate=hint_rate)
+            for key, values in future.items():
+                cumulative.setdefault(key, np.zeros(num_simulations))[bounds[column]:bounds[column + 1]] += values
+        previous_games = games
+        confidence = np.nan_to_num(predict_setting_batch(cumulative, model)[:, min_setting - 1:].sum(axis=1))
+        estimates.append(HorizonEstimate(games, float((confidence >= threshold).mean()), float(confidence.mean())))
+    return PlanReport(min_setting, threshold, float(posterior[min_setting - 1:].sum()), estimates)
+
+
+def format_plan(report):
+    lines = [f"現在の設定{report.min_setting}以上の確率: {report.current_confidence:.1%}"]
+    for estimate in report.horizons:
+        lines.append(
+            f"あと{estimate.games:>5}G: 設定{report.min_setting}以上が{report.threshold:.0%}を超えている確率 "
+            f"{estimate.crossing_probability:6.1%}（平均 {estimate.mean_confidence:.1%}）"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="あと何G回せば高設定と分かるかを見積もる")
+    parser.add_argument("--inputs", required=True, help="現在の入力（JSON、predict_setting と同じキー）")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(DEFAULT_HORIZONS), help="候補のゲーム数")
+    parser.add_argument("--min-setting", type=int, default=DEFAULT_MIN_SETTING, help="設定いくつ以上と分かればよいか")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="「分かった」とみなす確率")
+    parser.add_argument("--simulations", type=int, default=DEFAULT_NUM_SIMULATIONS, help="シミュレーションの回数")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args(argv)
+
+    report = plan_games_to_confidence(json.loads(args.inputs), horizons=args.horizons, min_setting=args.min_setting,
+                                      threshold=args.threshold, num_simulations=args.simulations, seed=args.seed)
+    print(format_plan(report))
+
+
+if __name__ == "__main__":
+    main()
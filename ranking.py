@@ -0,0 +1,229 @@
+"""
+大量の台・日の記録から「高設定の可能性が高い台」の上位K件を1回の走査で求める。
+
+    python ranking.py 月次.npy --query 6 --query 4+ --top 20
+    python ranking.py 月次.csv --schema schema.json --label-columns 店舗 台番号 日付 --query 5+ --json top.json
+
+記録は chunk-size 件ずつ predict_setting_batch で推測し、条件（「設定6」「設定4以上」など）ごとに
+件数 K のヒープだけを持つ。使用メモリは K と chunk-size で決まり、記録の件数には依存しない。
+入力は records.py の構造化配列（.npy、メモリマップで読む）、CSV、Parquet（pyarrow が必要）。
+"""
+import argparse
+import csv
+import heapq
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from core import predict_setting_batch
+from ingest import DEFAULT_CHUNK_SIZE, import_pyarrow, is_parquet, load_schema, resolve_schema, to_counts
+from records import load_records
+
+DEFAULT_TOP_K = 20
+DEFAULT_QUERIES = ("6", "5+")
+
+# 順位付けの条件。score は設定 min_setting〜max_setting の事後確率の合計
+RankQuery = namedtuple("RankQuery", ["name", "min_setting", "max_setting"])
+# 上位の1件
+# row: 入力の何件目か（0始まり）、label: --label-columns の値のタプル（なければ空）、
+# score: 条件の確率、posterior: 設定1〜6の事後確率（形状(6,)）
+RankedMachine = namedtuple("RankedMachine", ["row", "label", "score", "posterior"])
+
+
+def parse_query(text):
+    """「6」（設定6）、「5+」（設定5以上）、「2-4」（設定2〜4）を RankQuery にする"""
+    text = text.strip()
+    try:
+        if text.endswith("+"):
+            low, high = int(text[:-1]), 6
+            name = f"設定{low}以上"
+        elif "-" in text:
+            low, high = (int(part) for part in text.split("-", 1))
+            name = f"設定{low}〜{high}"
+        else:
+            low = high = int(text)
+            name = f"設定{low}"
+    except ValueError:
+        raise ValueError(f"条件の形式が不正です: {text!r}（例: 6 / 5+ / 2-4）") from None
+    if not 1 <= low <= high <= 6:
+        raise ValueError(f"条件の設定は1〜6で指定してください: {text!r}")
+    return RankQuery(name, low, high)
+
+
+class HotMachineRanking:
+    """
+    条件ごとに、確率の高い上位 top_k 件を最小ヒープで保持する。
+    add で推測結果をチャンク単位で渡し、results で確率の高い順に取り出す。
+    """
+
+    def __init__(self, queries, top_k=DEFAULT_TOP_K):
+        if top_k <= 0:
+            raise ValueError("top_k は1以上で指定してください")
+        self.queries = [parse_query(query) if isinstance(query, str) else query for query in queries]
+        self.top_k = top_k
+        self.num_rows = 0
+        # ヒープの要素は (score, -row, label, posterior)。同じ確率なら先に出てきた行を残す
+        self._heaps = {query: [] for query in self.queries}
+
+    def add(self, posteriors, labels=None):
+        """
+        形状(N, 6)の事後確率を追加する（行番号は追加した順に続けて振る）。
+        labels: 各行のラベル（長さNのシーケンス、省略時は空のタプル）。データのない行（NaN）は順位に入れない。
+        """
+        posteriors = np.asarray(posteriors, dtype=float).reshape(-1, 6)
+        start = self.num_rows
+        self.num_rows += len(posteriors)
+        for query in self.queries:
+            heap = self._heaps[query]
+            scores = posteriors[:, query.min_setting - 1:query.max_setting].sum(axis=1)
+            candidates = np.flatnonzero(~np.isnan(scores))
+            # ヒープが埋まっていれば、その最小値を超える行だけが候補になる
+            if len(heap) == self.top_k:
+                candidates = candidates[scores[candidates] > heap[0][0]]
+            # チャンク内の上位 top_k 件に絞ってからヒープに入れる（チャンク全体を並べ替えない）。
+            # k番目の値と同じ確率の行は、行番号の小さい方から残す
+            if len(candidates) > self.top_k:
+                candidate_scores = scores[candidates]
+                kth = np.partition(candidate_scores, len(candidates) - self.top_k)[len(candidates) - self.top_k]
+                above = candidates[candidate_scores > kth]
+                tied = candidates[candidate_scores == kth][:self.top_k - len(above)]
+                candidates = np.concatenate([above, tied])
+            for index in candidates.tolist():
+                # (score, -row) は行ごとに異なるので、ヒープの比較が label / posterior に及ぶことはない
+                entry = (float(scores[index]), -(start + index), labels[index] if labels is not None else (),
+                         posteriors[index].copy())
+                if len(heap) < self.top_k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+
+    def results(self):
+        """条件 → RankedMachine のリスト（確率の高い順、同じ確率なら行番号の小さい順）"""
+        return {
+            query: [
+                RankedMachine(-negative_row, label, score, posterior)
+                for score, negative_row, label, posterior in sorted(heap, key=lambda entry: entry[:2], reverse=True)
+            ]
+            for query, heap in self._heaps.items()
+        }
+
+
+# --- 入力の読み込み（chunk_size 件ずつ、(入力キー → 配列 または構造化配列, ラベルのリスト) を返す） ---
+def iter_record_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """records.py で保存した .npy をメモリマップで読み、chunk_size 件ずつ返す（ラベルはなし）"""
+    records = load_records(path)
+    for start in range(0, len(records), chunk_size):
+        yield records[start:start + chunk_size], None
+
+
+def iter_csv_chunks(path, schema=None, label_columns=(), chunk_size=DEFAULT_CHUNK_SIZE):
+    with open(path, newline="", encoding="utf-8-sig") as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [column for column in label_columns if column not in header]
+        if missing:
+            raise ValueError(f"列がありません: {', '.join(missing)}")
+        schema = resolve_schema(schema, header)
+        column_indices = {input_key: header.index(column) for input_key, column in schema.items()}
+        label_indices = [header.index(column) for column in label_columns]
+        while True:
+            rows = [row for _, row in zip(range(chunk_size), reader)]
+            if not rows:
+                return
+            columns = {
+                input_key: to_counts([row[index] if index < len(row) else "" for row in rows])
+                for input_key, index in column_indices.items()
+            }
+            labels = [tuple(row[index] if index < len(row) else "" for index in label_indices) for row in rows]
+            yield columns, labels
+
+
+def iter_parquet_chunks(path, schema=None, label_columns=(), chunk_size=DEFAULT_CHUNK_SIZE):
+    _, pq = import_pyarrow()
+    parquet_file = pq.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    missing = [column for column in label_columns if column not in names]
+    if missing:
+        raise ValueError(f"列がありません: {', '.join(missing)}")
+    schema = resolve_schema(schema, names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(dict.fromkeys([*schema.values(), *label_columns]))):
+        columns = {input_key: to_counts(batch.column(column).to_numpy(zero_copy_only=False)) for input_key, column in schema.items()}
+        label_values = [[str(value) for value in batch.column(column).to_pylist()] for column in label_columns]
+        yield columns, list(zip(*label_values)) if label_columns else None
+
+
+def rank_chunks(chunks, queries=DEFAULT_QUERIES, top_k=DEFAULT_TOP_K, model=None, prior=None):
+    """
+    iter_*_chunks の戻り値（または (入力, ラベル) の組のイテラブル）を1回走査して上位を求める。
+    戻り値: (条件 → RankedMachine のリスト, 走査した件数)
+    """
+    ranking = HotMachineRanking(queries, top_k)
+    for columns, labels in chunks:
+        ranking.add(predict_setting_batch(columns, model, prior=prior), labels)
+    return ranking.results(), ranking.num_rows
+
+
+def rank_file(path, queries=DEFAULT_QUERIES, top_k=DEFAULT_TOP_K, schema=None, label_columns=(),
+              chunk_size=DEFAULT_CHUNK_SIZE, model=None, prior=None):
+    """
+    ファイル（.npy / .csv / .parquet）の記録から上位を求める。戻り値は rank_chunks と同じ。
+    .npy は列名もラベルの列も持たないので、schema や label_columns を指定すると ValueError
+    """
+    if str(path).lower().endswith(".npy"):
+        if schema is not None or label_columns:
+            raise ValueError(".npy の入力には --schema と --label-columns を指定できません")
+        chunks = iter_record_chunks(path, chunk_size)
+    elif is_parquet(path):
+        chunks = iter_parquet_chunks(path, schema, label_columns, chunk_size)
+    else:
+        chunks = iter_csv_chunks(path, schema, label_columns, chunk_size)
+    return rank_chunks(chunks, queries, top_k, model, prior)
+
+
+def results_to_dict(results):
+    return {
+        query.name: [
+            {"row": machine.row, "label": list(machine.label), "score": machine.score,
+             "posterior": machine.posterior.tolist()}
+            for machine in machines
+        ]
+        for query, machines in results.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録から高設定の可能性が高い台の上位を求める")
+    parser.add_argument("input", help="入力ファイル（records.py の .npy / .csv / .parquet）")
+    parser.add_argument("--query", action="append", help="条件（6 = 設定6、5+ = 設定5以上、2-4 = 設定2〜4）。複数指定できる。既定: 6 と 5+")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_K, help="条件ごとの件数")
+    parser.add_argument("--schema", help="入力キー → 列名 の対応表（JSON）。省略時は列名＝入力キー")
+    parser.add_argument("--label-columns", nargs="*", default=[], help="結果に表示する列（例: 店舗 台番号 日付）")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help=f"一度に推測する件数（既定: {DEFAULT_CHUNK_SIZE}）")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+    if args.top <= 0 or args.chunk_size <= 0:
+        parser.error("--top と --chunk-size は1以上で指定してください")
+    try:
+        queries = [parse_query(query) for query in args.query or DEFAULT_QUERIES]
+        results, num_rows = rank_file(args.input, queries, args.top, load_schema(args.schema), args.label_columns,
+                                      args.chunk_size)
+    except ValueError as error:
+        parser.error(str(error))
+
+    print(f"{num_rows}件から上位{args.top}件", file=sys.stderr)
+    for query, machines in results.items():
+        print(f"--- {query.name} ---")
+        for rank, machine in enumerate(machines, start=1):
+            label = " ".join(machine.label) or f"{machine.row}行目"
+            print(f"{rank:>3}. {label}  {machine.score:.1%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results_to_dict(results), json_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
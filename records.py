@@ -0,0 +1,174 @@
+"""
+入力レコードのコンパクトな列形式（NumPyの構造化配列）。
+
+フィールドは INPUT_KEYS の順で、確率系の回数は uint16、総ゲーム数は uint32、示唆の出現回数は uint8。
+1件98バイトで、同じ内容の辞書（68キー）の数十分の一のメモリで済む。
+predict_setting / predict_setting_batch などの推測関数にそのまま渡せる（辞書に戻す必要はない）。
+
+    python records.py pack 日次.csv 日次.npy --schema schema.json   # CSVを構造化配列のファイルにする
+    python records.py unpack 日次.npy 日次.csv                       # 元の列名（入力キー）のCSVに戻す
+
+保存したファイルは load_records(path) でメモリマップして読み込める。
+"""
+import argparse
+import contextlib
+import csv
+import os
+import sys
+import warnings
+
+import numpy as np
+
+from core import HINT_DATA, INPUT_KEYS
+from ingest import DEFAULT_CHUNK_SIZE, load_schema, resolve_schema, to_counts
+
+# 値の範囲が広いフィールド（それ以外の確率系は uint16、示唆は uint8）
+WIDE_FIELDS = ("total_game_count",)
+
+RECORD_DTYPE = np.dtype([
+    (key, np.uint32 if key in WIDE_FIELDS else np.uint8 if key in HINT_DATA else np.uint16)
+    for key in INPUT_KEYS
+])
+
+
+def empty_records(num_records):
+    """全フィールドが0のレコードを num_records 件作る"""
+    return np.zeros(num_records, dtype=RECORD_DTYPE)
+
+
+def _check_range(key, values):
+    """値がフィールドの型に収まる0以上の整数かを調べる（収まらなければ ValueError）"""
+    values = np.asarray(values)
+    if values.dtype.kind not in "iub":
+        values = np.asarray(values, dtype=float)
+        if not np.array_equal(values, np.round(values)):
+            raise ValueError(f"{key}: 整数で指定してください")
+    limit = np.iinfo(RECORD_DTYPE[key]).max
+    if values.size and (values.min() < 0 or values.max() > limit):
+        raise ValueError(f"{key}: 0〜{limit} の範囲で指定してください")
+    return values
+
+
+def records_from_columns(columns):
+    """入力キー → 長さNの配列 をレコードの配列にする（足りないキーは0）"""
+    unknown = [key for key in columns if key not in RECORD_DTYPE.names]
+    if unknown:
+        raise ValueError(f"未知の入力キーです: {', '.join(unknown)}")
+    arrays = {key: _check_range(key, value).reshape(-1) for key, value in columns.items()}
+    records = empty_records(max((len(array) for array in arrays.values()), default=0))
+    for key, array in arrays.items():
+        records[key] = array
+    return records
+
+
+def records_from_dicts(inputs_list):
+    """user_inputs と同じ形式の辞書のリストをレコードの配列にする"""
+    inputs_list = list(inputs_list)
+    keys = list(dict.fromkeys(key for inputs in inputs_list for key in inputs))
+    return records_from_columns({key: [inputs.get(key, 0) for inputs in inputs_list] for key in keys})
+
+
+def record_from_dict(inputs):
+    """user_inputs の辞書を1件のレコード（np.void）にする"""
+    return records_from_dicts([inputs])[0]
+
+
+def record_to_dict(record):
+    """1件のレコードを user_inputs と同じ形式（全ての入力キー → int）の辞書にする"""
+    return dict(zip(RECORD_DTYPE.names, record.item()))
+
+
+def records_to_dicts(records):
+    return [dict(zip(RECORD_DTYPE.names, values)) for values in records.tolist()]
+
+
+def conform(records):
+    """別のフィールド構成で保存されたレコードを RECORD_DTYPE に合わせる（ないフィールドは0、余分は捨てる）"""
+    if records.dtype == RECORD_DTYPE:
+        return records
+    return records_from_columns({name: records[name] for name in records.dtype.names if name in RECORD_DTYPE.names})
+
+
+@contextlib.contextmanager
+def _quiet_npy_format():
+    """フィールド名が日本語なので .npy はバージョン3.0の形式になる（NumPy 1.17以降で読める）。その警告を抑える"""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="Stored array in format 3.0")
+        yield
+
+
+def save_records(path, records):
+    with _quiet_npy_format():
+        np.save(path, records, allow_pickle=False)
+
+
+def load_records(path, mmap=True):
+    """save_records で保存したレコードを読み込む（mmap なら必要な部分だけディスクから読む）"""
+    records = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    return conform(records)
+
+
+# --- CLI ---
+def pack_csv(input_path, output_path, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+    """CSV（1行 = 1台1日）をレコードのファイルにする。行数を返す（範囲外の値などで失敗したら出力ファイルを消す）"""
+    with open(input_path, newline="", encoding="utf-8-sig") as input_file:
+        num_rows = max(sum(1 for _ in csv.reader(input_file)) - 1, 0) # 先に行数を数えて出力ファイルの大きさを決める
+    with open(input_path, newline="", encoding="utf-8-sig") as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None) or []
+        schema = resolve_schema(schema, header)
+        column_indices = {input_key: header.index(column) for input_key, column in schema.items()}
+        with _quiet_npy_format():
+            records = np.lib.format.open_memmap(output_path, mode="w+", dtype=RECORD_DTYPE, shape=(num_rows,))
+        start = 0
+        try:
+            while True:
+                rows = [row for _, row in zip(range(chunk_size), reader)]
+                if not rows:
+                    break
+                columns = {
+                    input_key: to_counts([row[index] if index < len(row) else "" for row in rows])
+                    for input_key, index in column_indices.items()
+                }
+                records[start:start + len(rows)] = records_from_columns(columns)
+                start += len(rows)
+            records.flush()
+        except BaseException:
+            # 途中まで0で埋まったファイルを有効なデータとして読まれないようにする
+            del records
+            os.remove(output_path)
+            raise
+    return start
+
+
+def unpack_csv(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    records = load_records(input_path)
+    with open(output_path, "w", newline="", encoding="utf-8") as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(RECORD_DTYPE.names)
+        for start in range(0, len(records), chunk_size):
+            writer.writerows(records[start:start + chunk_size].tolist())
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入力レコードを構造化配列のファイルに変換する")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="CSVを構造化配列（.npy）にする")
+    pack_parser.add_argument("input")
+    pack_parser.add_argument("output")
+    pack_parser.add_argument("--schema", help="入力キー → 列名 の対応表（JSON）。省略時は列名＝入力キー")
+    unpack_parser = commands.add_parser("unpack", help="構造化配列（.npy）をCSVに戻す")
+    unpack_parser.add_argument("input")
+    unpack_parser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        num_rows = pack_csv(args.input, args.output, load_schema(args.schema))
+    else:
+        num_rows = unpack_csv(args.input, args.output)
+    print(f"{num_rows}行を変換しました: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+設定推測のHTTP/JSONサービス（Streamlitなしで使う端末・夜間バッチ向け）。
+
+    python service.py --port 8765 --workers 4
+
+POST /predict
+    1件: {"total_game_count": 3000, "at_first_hit_count": 10, ...}（predict_setting の入力と同じキー）
+    複数: [{...}, {...}] または {"records": [{...}, {...}]}
+    応答: {"posterior": [設定1〜6の確率], "predicted_setting": 設定} （複数なら {"results": [...]}）
+GET /health
+    {"status": "ok", "cache": {...}, "batches": 件数}
+
+同時に届いた小さなリクエストは、最大 max-delay ミリ秒待ってまとめ、
+predict_setting_batch で一度に推測する（マイクロバッチ）。結果は件数上限付きのLRUキャッシュに保持する。
+標準ライブラリの asyncio だけで動くので、追加のインストールは不要。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+from core import INPUT_KEYS, predict_setting_batch, warm_up
+
+DEFAULT_MAX_BATCH_SIZE = 512
+DEFAULT_MAX_DELAY_MS = 2.0
+DEFAULT_CACHE_SIZE = 100_000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+NO_DATA_MESSAGE = "データが入力されていません。推測を行うには、少なくとも1つの判別要素を入力してください。"
+CONTRADICTION_MESSAGE = "データが不足しているか、矛盾しているため、推測が困難です。入力値を見直してください。"
+
+
+class RequestError(Exception):
+    """リクエストの内容が不正（400を返す）"""
+
+
+def record_key(record):
+    """
+    入力1件を INPUT_KEYS の順の値のタプルにする（キャッシュのキー）。
+    未知のキーや数値でない値は RequestError にする。
+    """
+    if not isinstance(record, dict):
+        raise RequestError("各レコードはJSONオブジェクトで指定してください")
+    unknown = [key for key in record if key not in INPUT_KEYS]
+    if unknown:
+        raise RequestError(f"未知の入力キーです: {', '.join(unknown)}")
+    values = []
+    for key in INPUT_KEYS:
+        value = record.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise RequestError(f"{key}: 0以上の数値で指定してください")
+        values.append(float(value))
+    return tuple(values)
+
+
+def predict_keys(keys):
+    """record_key のリストをまとめて推測し、形状(N, 6)の事後確率を返す（ワーカーで実行）"""
+    values = np.array(keys, dtype=float).reshape(len(keys), len(INPUT_KEYS))
+    return predict_setting_batch({key: values[:, index] for index, key in enumerate(INPUT_KEYS)})
+
+
+def format_result(key, posterior):
+    """事後確率1件を応答のJSONオブジェクトにする"""
+    if np.isnan(posterior).any():
+        return {"posterior": None, "error": NO_DATA_MESSAGE if not any(key) else CONTRADICTION_MESSAGE}
+    return {"posterior": posterior.tolist(), "predicted_setting": int(posterior.argmax()) + 1}
+
+
+class ResultCache:
+    """件数上限付きのLRUキャッシュ（record_key → 事後確率）"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        posterior = self.entries.get(key)
+        if posterior is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return posterior
+
+    def put(self, key, posterior):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = posterior
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class MicroBatcher:
+    """
+    届いたレコードを最大 max_delay 秒（または max_batch_size 件）ためてから、
+    ワーカーで predict_keys をまとめて実行する。
+    """
+
+    def __init__(self, executor, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY_MS / 1000):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.num_batches = 0
+        self._pending = [] # (record_key のリスト, Future) のリスト
+        self._pending_count = 0
+        self._timer = None
+        self._tasks = set() # 実行中のバッチ（イベントループはタスクを弱参照でしか持たないため）
+
+    async def predict(self, keys):
+        """record_key のリストの事後確率（形状(N, 6)）を返す"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((keys, future))
+        self._pending_count += len(keys)
+        if self._pending_count >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_count = self._pending, [], 0
+        if pending:
+            self.num_batches += 1
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending):
+        keys = [key for request_keys, _ in pending for key in request_keys]
+        try:
+            posteriors = await asyncio.get_running_loop().run_in_executor(self.executor, predict_keys, keys)
+        except Exception as error: # ワーカーの失敗は待っている全リクエストに返す
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for request_keys, future in pending:
+            if not future.done():
+                future.set_result(posteriors[start:start + len(request_keys)])
+            start += len(request_keys)
+
+
+class PredictionService:
+    """リクエストの解釈、キャッシュ、マイクロバッチをまとめたもの"""
+
+    def __init__(self, batcher, cache):
+        self.batcher = batcher
+        self.cache = cache
+
+    async def predict_records(self, records):
+        keys = [record_key(record) for record in records]
+        posteriors = [self.cache.get(key) for key in keys]
+        missing = [index for index, posterior in enumerate(posteriors) if posterior is None]
+        if missing:
+            # 同じリクエスト内の重複はまとめて1回だけ推測する
+            unique_keys = list(dict.fromkeys(keys[index] for index in missing))
+            computed = dict(zip(unique_keys, await self.batcher.predict(unique_keys)))
+            for index in missing:
+                posteriors[index] = computed[keys[index]]
+            for key, posterior in computed.items():
+                self.cache.put(key, posterior)
+        return [format_result(key, posterior) for key, posterior in zip(keys, posteriors)]
+
+    async def handle(self, method, path, body):
+        """(HTTPステータス, 応答のJSONオブジェクト) を返す"""
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {"status": "ok", "cache": self.cache.stats(), "batches": self.batcher.num_batches}
+        if path != "/predict":
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "POST で送信してください"}
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "JSONとして読み込めません"}
+        try:
+            if isinstance(payload, list):
+                return HTTPStatus.OK, {"results": await self.predict_records(payload)}
+            if isinstance(payload, dict) and isinstance(payload.get("records"), list):
+                return HTTPStatus.OK, {"results": await self.predict_records(payload["records"])}
+            return HTTPStatus.OK, (await self.predict_records([payload]))[0]
+        except RequestError as error:
+            return HTTPStatus.BAD_REQUEST, {"error": str(error)}
+        except Exception as error: # 推測の失敗（ワーカーの例外など）
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"推測に失敗しました: {error}"}
+
+
+# --- HTTP/1.1（必要最小限） ---
+async def read_line(reader):
+    """1行読む。長すぎる行（StreamReader の limit 超え）は RequestError にする"""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise RequestError("リクエスト行またはヘッダーが長すぎます") from None
+
+
+def content_length(headers):
+    """Content-Length ヘッダーの値（省略時は0）。数値でない・負の値は RequestError にする"""
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise RequestError("Content-Length が不正です") from None
+    if length < 0:
+        raise RequestError("Content-Length が不正です")
+    if length > MAX_BODY_BYTES:
+        raise RequestError("リクエストが大きすぎます")
+    return length
+
+
+async def read_request(reader):
+    """(メソッド, パス, ヘッダー, ボディ) を返す。接続が閉じられたら None"""
+    request_line = await read_line(reader)
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise RequestError("不正なリクエスト行です")
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = content_length(headers)
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+def make_handler(service):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except RequestError as error:
+                    write_response(writer, HTTPStatus.BAD_REQUEST, {"error": str(error)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await service.handle(method, path, body)
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle_connection
+
+
+def make_executor(kind, workers):
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+    return ThreadPoolExecutor(max_workers=workers, initializer=warm_up)
+
+
+async def serve(host, port, executor, max_batch_size, max_delay_ms, cache_size):
+    batcher = MicroBatcher(executor, max_batch_size=max_batch_size, max_delay=max_delay_ms / 1000)
+    service = PredictionService(batcher, ResultCache(cache_size))
+    server = await asyncio.start_server(make_handler(service), host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"設定推測サービスを起動しました: {addresses}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="設定推測のHTTP/JSONサービス")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="推測を行うワーカー数")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread", help="ワーカーの種類")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="1回にまとめる最大レコード数")
+    parser.add_argument("--max-delay-ms", type=float, default=DEFAULT_MAX_DELAY_MS, help="まとめるために待つ最大時間（ミリ秒）")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="結果キャッシュの最大件数（0で無効）")
+    args = parser.parse_args(argv)
+
+    warm_up()
+    with make_executor(args.executor, args.workers) as executor:
+        try:
+            asyncio.run(serve(args.host, args.port, executor, args.max_batch_size, args.max_delay_ms, args.cache_size))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+設定ごとに疑似的な遊技データを生成して推測ロジックに通し、
+推測の正解率（混同行列）と確率の当てになり具合（キャリブレーション）を調べるシミュレーター。
+
+    python simulate.py --games 2000 5000 8000 --sessions 100000 --workers 4
+
+乱数生成と推測はNumPyでまとめて行い、チャンクごとにプロセスプールへ分散する。
+各プロセスは集計結果（6×6の混同行列とビンごとの合計）だけを返すので、
+数百万セッションでもプロセス間の転送量は小さい。
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core import DEFAULT_MODEL, predict_setting_batch
+
+# 他の入力値から決まる試行回数（試行回数の入力キー → 元になる入力キー）
+# それ以外の試行回数（弱チェリー成立回数など）は trial_rates で1Gあたりの発生率を与えたときだけ生成する
+DERIVED_TOTALS = {
+    "ura_at_total_count": "at_first_hit_count", # 通常時からのAT初当り ≒ AT初当り
+}
+
+DEFAULT_HINT_RATE = 0.02 # AT初当り1回あたり、各示唆が最も出やすい設定で出現する確率
+DEFAULT_CHUNK_SIZE = 20_000
+CALIBRATION_BINS = 10
+
+# シミュレーション結果
+# games: 総ゲーム数、num_sessions: 設定ごとのセッション数、
+# confusion: 形状(6, 6)の回数（行=真の設定、列=推測した設定）、
+# calibration: (ビンごとの予測確率の平均, 実際の的中率, 件数) 、accuracy: 正解率
+SimulationReport = namedtuple("SimulationReport", ["games", "num_sessions", "confusion", "calibration", "accuracy"])
+
+
+def simulate_sessions(setting, num_sessions, games, rng, model=None, trial_rates=None, hint_rate=DEFAULT_HINT_RATE):
+    """
+    設定 setting の台を games G遊技したセッションを num_sessions 件生成する。
+    戻り値: 入力キー → 長さ num_sessions の配列（predict_setting_batch にそのまま渡せる）
+    trial_rates: 試行回数の入力キー → 1Gあたりの発生率（例: {"weak_cherry_count": 1 / 80}）
+    hint_rate: 示唆の出現率。各示唆は設定ごとに「倍率 / 最大倍率」に比例して出現する。
+    """
+    model = model or DEFAULT_MODEL
+    column = setting - 1
+    columns = {"total_game_count": np.full(num_sessions, games, dtype=np.int64)}
+    for total_key, rate in (trial_rates or {}).items():
+        columns[total_key] = rng.binomial(games, rate, num_sessions)
+
+    # 試行回数が先に決まる要素から順に、観測回数を二項分布で生成する
+    pending = list(model.factors)
+    while pending:
+        deferred = []
+        for factor in pending:
+            _, observed_key, total_key, rates, _ = factor
+            if total_key not in columns and total_key in DERIVED_TOTALS and DERIVED_TOTALS[total_key] in columns:
+                columns[total_key] = columns[DERIVED_TOTALS[total_key]].copy()
+            if total_key not in columns:
+                deferred.append(factor)
+                continue
+            if observed_key not in columns:
+                columns[observed_key] = rng.binomial(columns[total_key], min(rates[column], 1.0))
+        if len(deferred) == len(pending): # これ以上試行回数が決まらない要素は生成しない
+            break
+        pending = deferred
+
+    # 振り分け系の要素は、試行回数が決まっていれば多項分布で各カテゴリーに振り分ける
+    for _, total_key, count_keys, probabilities, _ in model.categorical_factors:
+        if total_key in columns and not any(key in columns for key in count_keys):
+            counts = rng.multinomial(columns[total_key], probabilities[:, column])
+            columns.update({key: counts[:, index] for index, key in enumerate(count_keys)})
+
+    # 示唆はAT初当り1回ごとに出現の機会があるものとする
+    if hint_rate > 0 and "at_first_hit_count" in columns:
+        multipliers = np.exp(model.hint_log_multipliers)
+        appearance_rates = hint_rate * multipliers[:, column] / multipliers.max(axis=1)
+        at_hits = columns["at_first_hit_count"]
+        for hint_key, appearance_rate in zip(model.hint_keys, appearance_rates):
+            columns[hint_key] = rng.binomial(at_hits, appearance_rate)
+    return columns
+
+
+def _evaluate_chunk(args):
+    """1チャンク分（各設定 num_sessions 件）を生成・推測し、集計結果を返す（プロセスプール用）"""
+    games, num_sessions, seed, trial_rates, hint_rate = args
+    rng = np.random.default_rng(seed)
+    confusion = np.zeros((6, 6), dtype=np.int64)
+    bin_counts = np.zeros(CALIBRATION_BINS)
+    bin_predicted = np.zeros(CALIBRATION_BINS)
+    bin_hits = np.zeros(CALIBRATION_BINS)
+    for setting in range(1, 7):
+        columns = simulate_sessions(setting, num_sessions, games, rng, trial_rates=trial_rates, hint_rate=hint_rate)
+        posteriors = np.nan_to_num(predict_setting_batch(columns), nan=1 / 6)
+        confusion[setting - 1] += np.bincount(posteriors.argmax(axis=1), minlength=6)
+
+        # 全ての (セッション, 設定) の組について、予測確率と「その設定が正解か」をビンごとに集計する
+        outcomes = np.zeros_like(posteriors)
+        outcomes[:, setting - 1] = 1.0
+        bins = np.minimum((posteriors * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1).ravel()
+        bin_counts += np.bincount(bins, minlength=CALIBRATION_BINS)
+        bin_predicted += np.bincount(bins, weights=posteriors.ravel(), minlength=CALIBRATION_BINS)
+        bin_hits += np.bincount(bins, weights=outcomes.ravel(), minlength=CALIBRATION_BINS)
+    return confusion, bin_counts, bin_predicted, bin_hits
+
+
+def evaluate(games, num_sessions, workers=None, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, trial_rates=None, hint_rate=DEFAULT_HINT_RATE):
+    """
+    設定1〜6それぞれ num_sessions 件のセッションで推測精度を調べる。
+    workers: プロセス数（1ならプロセスプールを使わない、None ならCPU数）
+    同じ seed / chunk_size なら workers によらず同じ結果になる。
+    """
+    chunk_sizes = [min(chunk_size, num_sessions - start) for start in range(0, num_sessions, chunk_size)]
+    seeds = np.random.SeedSequence([seed, games]).spawn(len(chunk_sizes))
+    tasks = [(games, size, chunk_seed, trial_rates, hint_rate) for size, chunk_seed in zip(chunk_sizes, seeds)]
+
+    if workers == 1 or len(tasks) == 1:
+        results = list(map(_evaluate_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            results = list(executor.map(_evaluate_chunk, tasks))
+
+    confusion = np.zeros((6, 6), dtype=np.int64)
+    bin_counts, bin_predicted, bin_hits = np.zeros((3, CALIBRATION_BINS))
+    for chunk_confusion, chunk_counts, chunk_predicted, chunk_hits in results:
+        confusion += chunk_confusion
+        bin_counts += chunk_counts
+        bin_predicted += chunk_predicted
+        bin_hits += chunk_hits
+
+    with np.errstate(invalid="ignore"):
+        calibration = (bin_predicted / bin_counts, bin_hits / bin_counts, bin_counts.astype(np.int64))
+    accuracy = np.trace(confusion) / confusion.sum()
+    return SimulationReport(games, num_sessions, confusion, calibration, accuracy)
+
+
+def format_report(report):
+    """シミュレーション結果を表形式の文字列にする"""
+    lines = [f"## {report.games}G × {report.num_sessions}セッション/設定 正解率: {report.accuracy:.2%}", "", "混同行列（行=真の設定、列=推測した設定、行ごとの割合）"]
+    lines.append("      " + "".join(f"{f'設定{s}':>8}" for s in range(1, 7)))
+    for setting, row in enumerate(report.confusion, start=1):
+        lines.append(f"設定{setting}  " + "".join(f"{value:>9.1%}" for value in row / row.sum()))
+    lines += ["", "キャリブレーション（予測確率 → 実際の的中率）"]
+    for index, (predicted, observed, count) in enumerate(zip(*report.calibration)):
+        if count:
+            lines.append(f"  {index / CALIBRATION_BINS:.1f}-{(index + 1) / CALIBRATION_BINS:.1f}: 予測 {predicted:.3f} / 実際 {observed:.3f} ({count}件)")
+    return "\n".join(lines)
+
+
+def report_to_dict(report):
+    """シミュレーション結果をJSONに書き出せる辞書にする"""
+    predicted, observed, counts = report.calibration
+    return {
+        "games": report.games,
+        "num_sessions": report.num_sessions,
+        "accuracy": float(report.accuracy),
+        "confusion": report.confusion.tolist(),
+        "calibration": {
+            "predicted": np.where(counts > 0, predicted, None).tolist(),
+            "observed": np.where(counts > 0, observed, None).tolist(),
+            "counts": counts.tolist(),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="疑似セッションで設定推測の精度を調べる")
+    parser.add_argument("--games", type=int, nargs="+", default=[2000, 5000, 8000], help="1セッションの総ゲーム数（複数指定可）")
+    parser.add_argument("--sessions", type=int, default=10_000, help="設定ごとのセッション数")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU数）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="1タスクあたりのセッション数（設定ごと）")
+    parser.add_argument("--hint-rate", type=float, default=DEFAULT_HINT_RATE, help="AT初当り1回あたりの示唆出現率（0で示唆なし）")
+    parser.add_argument("--trial-rate", action="append", default=[], metavar="KEY=RATE",
+                        help="試行回数の入力キーと1Gあたりの発生率（例: weak_cherry_count=0.0125）")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+
+    trial_rates = {}
+    for item in args.trial_rate:
+        key, _, rate = item.partition("=")
+        try:
+            trial_rates[key] = float(rate)
+        except ValueError:
+            parser.error(f"--trial-rate は KEY=RATE の形式で指定してください: {item}")
+
+    reports = [
+        evaluate(games, args.sessions, workers=args.workers, seed=args.seed, chunk_size=args.chunk_size,
+                 trial_rates=trial_rates, hint_rate=args.hint_rate)
+        for games in args.games
+    ]
+    for report in reports:
+        print(format_report(report))
+        print()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump([report_to_dict(report) for report in reports], json_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+機種のスペック表の登録簿（レジストリ）。
+
+スペック表は specs/<機種>/<版>.json に1版1ファイルで置き、(機種, 版) で引く。
+ファイルは初めて使うときに読み込んで形式を検証し、プロセス内で使い回す。
+SPEC_PATH 環境変数（os.pathsep 区切り）や register_spec_dir で追加したディレクトリは、
+同梱の specs/ より優先して探す。
+
+ファイルの形式（format 1）:
+    machine, revision: ディレクトリ名・ファイル名と一致させる
+    game_data: {要素名: [設定1〜6の値]}  値は1/X.Xの場合のX.X、または%の場合の小数（例: 0.27%は0.0027）
+    hint_data: {示唆名: {"type": 示唆タイプ, ...}}
+        type: exact_setting, min_setting, exclude_setting, even_settings, odd_settings, normal, high_settings
+        value_multiplier: 示唆が出た場合に、その設定の尤度をどれだけ強く（または弱く）するか
+        exclude_multiplier: 示唆に反する設定の尤度をどれだけ減らすか
+
+    python spec_registry.py list                  # 登録されている機種と版
+    python spec_registry.py validate 2.json       # ファイルの形式を検証する
+"""
+import argparse
+import functools
+import hashlib
+import json
+import math
+import os
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+SPEC_DIR = Path(__file__).resolve().parent / "specs"
+SPEC_FORMAT = 1
+DEFAULT_MACHINE = "tokyo_ghoul"
+
+# 示唆タイプの一覧と、タイプごとに必要な項目
+HINT_TYPES = ("exact_setting", "min_setting", "exclude_setting", "even_settings", "odd_settings", "normal", "high_settings")
+HINT_REQUIRED_FIELDS = {
+    "exact_setting": ("setting",),
+    "min_setting": ("setting",),
+    "exclude_setting": ("setting",),
+    "even_settings": ("settings",),
+    "odd_settings": ("settings",),
+    "high_settings": ("settings",),
+    "normal": (),
+}
+
+# 読み込んだスペック表
+# game_data / hint_data: core の GAME_DATA / HINT_DATA と同じ形式、digest: ファイルのSHA-256
+Spec = namedtuple("Spec", ["machine", "revision", "name", "game_data", "hint_data", "digest"])
+
+_extra_dirs = [Path(path) for path in os.environ.get("SPEC_PATH", "").split(os.pathsep) if path]
+
+
+class SpecError(ValueError):
+    """スペック表のファイルが見つからない、または形式が正しくない"""
+
+
+def register_spec_dir(path):
+    """スペック表を探すディレクトリを追加する（先に追加したものより優先）"""
+    _extra_dirs.insert(0, Path(path))
+    spec_path.cache_clear()
+    load_spec_revision.cache_clear()
+
+
+def spec_dirs():
+    return [*_extra_dirs, SPEC_DIR]
+
+
+def available_machines():
+    """登録されている機種名の一覧"""
+    return sorted({path.name for directory in spec_dirs() if directory.is_dir() for path in directory.iterdir() if path.is_dir()})
+
+
+def available_revisions(machine):
+    """機種の版の一覧（昇順）。ファイル名だけを見るので、中身は読み込まない"""
+    revisions = set()
+    for directory in spec_dirs():
+        for path in (directory / machine).glob("*.json"):
+            if path.stem.isdigit():
+                revisions.add(int(path.stem))
+    return sorted(revisions)
+
+
+def resolve_revision(machine, revision=None):
+    """版の指定を解決する（None なら最新の版）"""
+    revisions = available_revisions(machine)
+    if not revisions:
+        raise SpecError(f"機種 {machine} のスペック表がありません")
+    if revision is None:
+        return revisions[-1]
+    if int(revision) not in revisions:
+        raise SpecError(f"機種 {machine} に版 {revision} はありません（{', '.join(map(str, revisions))}）")
+    return int(revision)
+
+
+@functools.lru_cache(maxsize=None)
+def spec_path(machine, revision):
+    for directory in spec_dirs():
+        path = directory / machine / f"{revision}.json"
+        if path.is_file():
+            return path
+    raise SpecError(f"機種 {machine} に版 {revision} はありません")
+
+
+def spec_digest(machine, revision=None):
+    """スペック表のファイルのSHA-256（コンパイル済みキャッシュのキー）。JSONとしては読み込まない"""
+    return hashlib.sha256(spec_path(machine, resolve_revision(machine, revision)).read_bytes()).hexdigest()
+
+
+def _check_setting(value, where):
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= 6:
+        raise SpecError(f"{where}: 設定は1〜6の整数で指定してください")
+
+
+def _check_positive(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise SpecError(f"{where}: 正の数で指定してください")
+
+
+def validate_spec(document, source="スペック表"):
+    """
+    JSONから読み込んだスペック表を検証し、(game_data, hint_data) を core と同じ形式で返す。
+    形式が正しくなければ SpecError
+    """
+    if not isinstance(document, dict):
+        raise SpecError(f"{source}: JSONオブジェクトではありません")
+    if document.get("format") != SPEC_FORMAT:
+        raise SpecError(f"{source}: 対応していない形式です: {document.get('format')}")
+    for field in ("machine", "revision", "game_data", "hint_data"):
+        if field not in document:
+            raise SpecError(f"{source}: {field} がありません")
+
+    game_data = {}
+    if not isinstance(document["game_data"], dict):
+        raise SpecError(f"{source}: game_data はオブジェクトで指定してください")
+    for game_key, values in document["game_data"].items():
+        if not isinstance(values, list) or len(values) != 6:
+            raise SpecError(f"{source}: {game_key}: 設定1〜6の6つの値を指定してください")
+        for value in values:
+            _check_positive(value, f"{source}: {game_key}")
+        game_data[game_key] = {setting: value for setting, value in enumerate(values, start=1)}
+
+    hint_data = {}
+    if not isinstance(document["hint_data"], dict):
+        raise SpecError(f"{source}: hint_data はオブジェクトで指定してください")
+    for hint_key, hint_info in document["hint_data"].items():
+        where = f"{source}: {hint_key}"
+        if not isinstance(hint_info, dict) or hint_info.get("type") not in HINT_TYPES:
+            raise SpecError(f"{where}: type は {', '.join(HINT_TYPES)} のいずれかで指定してください")
+        for field in HINT_REQUIRED_FIELDS[hint_info["type"]]:
+            if field not in hint_info:
+                raise SpecError(f"{where}: {field} がありません")
+        if "setting" in hint_info:
+            _check_setting(hint_info["setting"], where)
+        if "settings" in hint_info:
+            if not isinstance(hint_info["settings"], list):
+                raise SpecError(f"{where}: settings はリストで指定してください")
+            for setting in hint_info["settings"]:
+                _check_setting(setting, where)
+        for field in ("value_multiplier", "exclude_multiplier"):
+            if field in hint_info:
+                _check_positive(hint_info[field], f"{where}: {field}")
+        hint_data[hint_key] = hint_info
+    return game_data, hint_data
+
+
+def read_spec_file(path):
+    """スペック表のファイルを読み込んで検証し、Spec を返す"""
+    path = Path(path)
+    content = path.read_bytes()
+    try:
+        document = json.loads(content.decode("utf-8"))
+    except ValueError as error:
+        raise SpecError(f"{path}: JSONとして読み込めません: {error}") from None
+    game_data, hint_data = validate_spec(document, str(path))
+    return Spec(document["machine"], document["revision"], document.get("name", document["machine"]),
+                game_data, hint_data, hashlib.sha256(content).hexdigest())
+
+
+@functools.lru_cache(maxsize=None)
+def load_spec_revision(machine, revision):
+    path = spec_path(machine, revision)
+    spec = read_spec_file(path)
+    if (spec.machine, spec.revision) != (machine, revision):
+        raise SpecError(f"{path}: machine / revision がファイルの場所と一致しません")
+    return spec
+
+
+def load_spec(machine=DEFAULT_MACHINE, revision=None):
+    """(機種, 版) のスペック表を返す（revision を省略すると最新の版）。ファイルは一度だけ読み込む"""
+    return load_spec_revision(machine, resolve_revision(machine, revision))
+
+
+def format_spec(document):
+    """スペック表の内容を同梱のファイルと同じ体裁（game_data / hint_data は1項目1行）のJSONにする"""
+    lines = []
+    for key, value in document.items():
+        if key in ("game_data", "hint_data"):
+            entries = [f"    {json.dumps(name, ensure_ascii=False)}: {json.dumps(entry, ensure_ascii=False)}" for name, entry in value.items()]
+            lines.append(f"  {json.dumps(key)}: {{\n" + ",\n".join(entries) + "\n  }")
+        else:
+            lines.append(f"  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}")
+    return "{\n" + ",\n".join(lines) + "\n}\n"
+
+
+def write_spec(machine, revision, game_data, hint_data, name=None, notes=None, directory=None):
+    """
+    スペック表を <directory>/<機種>/<版>.json（directory の既定は specs/）に書き出し、そのパスを返す。
+    game_data / hint_data は core と同じ形式。書き出す前に検証し、同じ版のファイルが既にあれば SpecError にする。
+    """
+    path = Path(directory or SPEC_DIR) / machine / f"{revision}.json"
+    if path.exists():
+        raise SpecError(f"{path}: 既にあります")
+    document = {"format": SPEC_FORMAT, "machine": machine, "revision": revision, "name": name or machine}
+    if notes:
+        document["notes"] = notes
+    document["game_data"] = {game_key: [values[setting] for setting in range(1, 7)] for game_key, values in game_data.items()}
+    document["hint_data"] = hint_data
+    validate_spec(document, str(path))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(format_spec(document), encoding="utf-8")
+    spec_path.cache_clear()
+    return path
+
+
+def compiled_cache_dir():
+    """コンパイル済みのスペック表を保存するディレクトリ（SPEC_CACHE_DIR 環境変数で変更できる）"""
+    return Path(os.environ.get("SPEC_CACHE_DIR") or Path.home() / ".cache" / "tokyo-ghoul-tool")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="機種のスペック表の一覧と検証")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="登録されている機種と版を表示する")
+    validate_parser = commands.add_parser("validate", help="スペック表のファイルを検証する")
+    validate_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for machine in available_machines():
+            revisions = available_revisions(machine)
+            print(f"{machine}: {', '.join(map(str, revisions))}（最新 {revisions[-1]}）" if revisions else f"{machine}: なし")
+        return
+    failed = False
+    for path in args.paths:
+        try:
+            spec = read_spec_file(path)
+        except (OSError, SpecError) as error:
+            print(f"NG {error}", file=sys.stderr)
+            failed = True
+        else:
+            print(f"OK {path}: {spec.machine} 版{spec.revision}  要素{len(spec.game_data)}件・示唆{len(spec.hint_data)}件")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+推測結果の履歴（店舗・台番号・日付ごとの入力と設定1〜6の事後確率）をSQLiteに保存・検索する。
+
+    python store.py import history.sqlite 推測済み.csv --hall 店舗A --machine-column 台番号 --date-column 日付
+    python store.py query history.sqlite --min-setting 5 --min-probability 0.6 --days 7
+
+import は ingest.py の出力（posterior_1〜6 の列があるCSV）をまとめて取り込む。
+データベースはWALモードで開くので、アプリが読んでいる間も書き込める。
+"""
+import argparse
+import csv
+import datetime
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from core import INPUT_KEYS
+from ingest import POSTERIOR_COLUMNS, to_counts
+
+DEFAULT_DB_PATH = "history.sqlite"
+INSERT_BATCH_SIZE = 10_000
+
+# 事後確率は設定1〜6の確率（p1〜p6）と、「設定k以上」の確率（ge2〜ge6）の両方を列に持つ。
+# 「設定5以上の確率が0.6超」のような検索を ge5 の索引で引けるようにするため
+PROBABILITY_COLUMNS = [f"p{setting}" for setting in range(1, 7)]
+AT_LEAST_COLUMNS = {setting: f"ge{setting}" for setting in range(2, 7)}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    hall TEXT NOT NULL DEFAULT '',
+    machine_number TEXT NOT NULL DEFAULT '',
+    play_date TEXT NOT NULL,
+    saved_at REAL NOT NULL,
+    inputs TEXT NOT NULL,
+    {", ".join(f"{column} REAL" for column in PROBABILITY_COLUMNS + list(AT_LEAST_COLUMNS.values()))}
+);
+CREATE INDEX IF NOT EXISTS sessions_play_date ON sessions (play_date);
+CREATE INDEX IF NOT EXISTS sessions_machine ON sessions (hall, machine_number, play_date);
+{"".join(f"CREATE INDEX IF NOT EXISTS sessions_{column} ON sessions ({column}, play_date);" for column in AT_LEAST_COLUMNS.values())}
+"""
+
+# 保存した1件
+# inputs: 入力キー → 値（0の項目は省く）、posterior: 設定1〜6の事後確率（形状(6,)、データなしならNaN）
+SessionRecord = namedtuple("SessionRecord", ["id", "hall", "machine_number", "play_date", "saved_at", "inputs", "posterior"])
+
+
+def date_text(value):
+    """日付（date / datetime / 'YYYY-MM-DD' の文字列）を 'YYYY-MM-DD' にする"""
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return datetime.date.fromisoformat(str(value).strip().replace("/", "-")).isoformat()
+
+
+def inputs_text(inputs):
+    """入力の辞書を保存用のJSONにする（0の項目は省く）"""
+    return json.dumps({key: value for key, value in inputs.items() if value}, ensure_ascii=False, separators=(",", ":"))
+
+
+def probability_rows(posteriors):
+    """形状(N, 6)の事後確率を、1件ずつ p1〜p6, ge2〜ge6 の列の値のリストにする（NaNの行は NULL）"""
+    posteriors = np.asarray(posteriors, dtype=float).reshape(-1, 6)
+    at_least = np.cumsum(posteriors[:, ::-1], axis=1)[:, ::-1] # at_least[:, k-1] = P(設定k以上)
+    values = np.hstack([posteriors, at_least[:, 1:]])
+    rows = values.tolist()
+    for index in np.flatnonzero(np.isnan(posteriors).any(axis=1)):
+        rows[index] = [None] * values.shape[1]
+    return rows
+
+
+class HistoryStore:
+    """推測結果の履歴のSQLiteデータベース（Streamlitの複数セッションから共有できるよう、接続はロックで守る）"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # WALではコミットごとのfsyncを省いても壊れない
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, hall, machine_number, play_date, inputs, posterior):
+        """1件保存して、その id を返す"""
+        row = self._rows([(hall, machine_number, play_date, inputs, posterior)], time.time())[0]
+        with self._lock, self.connection:
+            cursor = self.connection.execute(self._insert_sql(), row)
+        return cursor.lastrowid
+
+    def save_many(self, records):
+        """
+        (店舗, 台番号, 日付, 入力の辞書, 事後確率) の組をまとめて保存し、件数を返す。
+        INSERT_BATCH_SIZE 件ごとに1トランザクションで書き込む。
+        """
+        saved_at = time.time()
+        records = iter(records)
+        count = 0
+        while True:
+            batch = [record for _, record in zip(range(INSERT_BATCH_SIZE), records)]
+            if not batch:
+                return count
+            rows = self._rows(batch, saved_at)
+            with self._lock, self.connection:
+                self.connection.executemany(self._insert_sql(), rows)
+            count += len(rows)
+
+    @staticmethod
+    def _insert_sql():
+        columns = ["hall", "machine_number", "play_date", "saved_at", "inputs"] + PROBABILITY_COLUMNS + list(AT_LEAST_COLUMNS.values())
+        return f"INSERT INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    @staticmethod
+    def _rows(records, saved_at):
+        probabilities = probability_rows([record[4] for record in records])
+        return [
+            [hall or "", str(machine_number or ""), date_text(play_date), saved_at, inputs_text(inputs)] + values
+            for (hall, machine_number, play_date, inputs, _), values in zip(records, probabilities)
+        ]
+
+    def load(self, session_id):
+        """id の1件を SessionRecord で返す（なければ None）"""
+        rows = self._select("WHERE id = ?", [session_id])
+        return rows[0] if rows else None
+
+    def recent(self, hall=None, machine_number=None, limit=50):
+        """新しい順に最大 limit 件（店舗・台番号で絞り込める）"""
+        conditions, parameters = [], []
+        if hall is not None:
+            conditions.append("hall = ?")
+            parameters.append(hall)
+        if machine_number is not None:
+            conditions.append("machine_number = ?")
+            parameters.append(str(machine_number))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return self._select(f"{where}ORDER BY id DESC LIMIT ?", parameters + [limit])
+
+    def high_setting_sessions(self, min_setting=5, min_probability=0.6, days=7, today=None, hall=None):
+        """
+        直近 days 日（today を含む）で、設定 min_setting 以上の確率が min_probability を超える記録を
+        確率の高い順に返す。
+        """
+        if min_setting not in AT_LEAST_COLUMNS:
+            raise ValueError("min_setting は2〜6で指定してください")
+        column = AT_LEAST_COLUMNS[min_setting]
+        today = datetime.date.fromisoformat(date_text(today or datetime.date.today()))
+        since = (today - datetime.timedelta(days=days - 1)).isoformat()
+        conditions = [f"{column} > ?", "play_date BETWEEN ? AND ?"]
+        parameters = [min_probability, since, today.isoformat()]
+        if hall is not None:
+            conditions.append("hall = ?")
+            parameters.append(hall)
+        return self._select(f"WHERE {' AND '.join(conditions)} ORDER BY {column} DESC", parameters)
+
+    def _select(self, clause, parameters):
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT id, hall, machine_number, play_date, saved_at, inputs, {', '.join(PROBABILITY_COLUMNS)} FROM sessions {clause}",
+                parameters,
+            ).fetchall()
+        return [
+            SessionRecord(*row[:5], json.loads(row[5]), np.array([np.nan if value is None else value for value in row[6:]]))
+            for row in rows
+        ]
+
+
+# --- CLI ---
+def import_scored_csv(store, path, hall, machine_column, date_column, default_date=None):
+    """ingest.py の出力CSVを取り込み、件数を返す"""
+    with open(path, newline="", encoding="utf-8-sig") as input_file:
+        reader = csv.DictReader(input_file)
+        if reader.fieldnames is None:
+            return 0
+        missing = [column for column in POSTERIOR_COLUMNS + [machine_column, date_column] if column and column not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"{path}: 列がありません: {', '.join(missing)}")
+        input_columns = [key for key in reader.fieldnames if key in INPUT_KEYS]
+
+        def records():
+            for row in reader:
+                inputs = {key: value for key, value in zip(input_columns, to_counts([row[key] for key in input_columns]).tolist())}
+                posterior = np.array([float(row[column] or "nan") for column in POSTERIOR_COLUMNS])
+                yield (hall, row[machine_column] if machine_column else "",
+                       row[date_column] if date_column else default_date, inputs, posterior)
+
+        return store.save_many(records())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="推測結果の履歴の取り込みと検索")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="ingest.py の出力CSVを取り込む")
+    import_parser.add_argument("database")
+    import_parser.add_argument("csv")
+    import_parser.add_argument("--hall", default="", help="店舗名")
+    import_parser.add_argument("--machine-column", help="台番号の列名")
+    import_parser.add_argument("--date-column", help="日付の列名（省略時は --date）")
+    import_parser.add_argument("--date", default=datetime.date.today().isoformat(), help="全行の日付（--date-column がない場合）")
+    query_parser = commands.add_parser("query", help="高設定の可能性が高い台を探す")
+    query_parser.add_argument("database")
+    query_parser.add_argument("--min-setting", type=int, default=5, help="設定いくつ以上の確率で絞るか")
+    query_parser.add_argument("--min-probability", type=float, default=0.6)
+    query_parser.add_argument("--days", type=int, default=7, help="直近何日分か")
+    query_parser.add_argument("--hall", help="店舗名で絞り込む")
+    args = parser.parse_args(argv)
+
+    with HistoryStore(args.database) as store:
+        if args.command == "import":
+            count = import_scored_csv(store, args.csv, args.hall, args.machine_column, args.date_column, args.date)
+            print(f"{count}件を取り込みました: {args.database}", file=sys.stderr)
+            return
+        try:
+            records = store.high_setting_sessions(args.min_setting, args.min_probability, args.days, hall=args.hall)
+        except ValueError as error:
+            parser.error(str(error))
+        for record in records:
+            probability = record.posterior[args.min_setting - 1:].sum()
+            print(f"{record.play_date}  {record.hall}  {record.machine_number:>6}  設定{args.min_setting}以上 {probability:.1%}")
+
+
+if __name__ == "__main__":
+    main()
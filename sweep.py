@@ -0,0 +1,165 @@
+"""
+スペック表の感度分析。GAME_DATA の各行と HINT_DATA の倍率を1つずつ範囲の両端まで動かして
+固定のデータセットを推測し直し、事後確率がどれだけ動くかを項目ごとに表示する。
+
+    python sweep.py --records 日次.npy --game-range 0.9 1.1 --hint-range 0.1 10 --workers 4
+    python sweep.py --simulate 20000 --games 5000 --json sweep.json
+
+データセット（records の構造化配列）は共有メモリに一度だけ置き、各ワーカーはそれを参照する。
+タスクとして送るのは (項目, 倍率) だけなので、データセットがタスクごとに pickle されることはない。
+"""
+import argparse
+import copy
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core import CATEGORICAL_FACTORS, PROBABILITY_FACTORS, compile_model, predict_setting_batch
+from records import RECORD_DTYPE, load_records, records_from_columns
+from simulate import simulate_sessions
+from spec_registry import DEFAULT_MACHINE, load_spec
+
+DEFAULT_GAME_RANGE = (0.9, 1.1) # GAME_DATA の行全体に掛ける倍率の範囲
+DEFAULT_HINT_RANGE = (0.1, 10.0) # 示唆の倍率（value_multiplier / exclude_multiplier）に掛ける倍率の範囲
+HINT_PARAMETERS = ("value_multiplier", "exclude_multiplier")
+SEED = 0
+
+# 動かす GAME_DATA の行 → %形式かどうか（振り分け系の行は%形式で、推測時に設定ごとに正規化される）
+IS_PROBABILITY_RATE = {game_key: is_probability_rate for game_key, _, _, is_probability_rate in PROBABILITY_FACTORS}
+IS_PROBABILITY_RATE.update({game_key: True for _, _, categories in CATEGORICAL_FACTORS for game_key, _ in categories})
+
+# 1項目の結果
+# parameter: 項目名、factor: 掛けた倍率、mean_shift / max_shift: 事後確率の変化（全変動距離）の平均・最大、
+# setting_shift: 設定1〜6の事後確率の平均の変化（形状(6,)）
+SweepResult = namedtuple("SweepResult", ["parameter", "factor", "mean_shift", "max_shift", "setting_shift"])
+
+# ワーカーごとの状態（_attach_dataset で設定する）
+_worker = {}
+
+
+def sweep_parameters(game_data, hint_data, game_range=DEFAULT_GAME_RANGE, hint_range=DEFAULT_HINT_RANGE):
+    """動かす (項目名, 倍率) の一覧。項目名は「GAME_DATAのキー」または「HINT_DATAのキー:倍率の種類」"""
+    tasks = []
+    for game_key in game_data:
+        if game_key in IS_PROBABILITY_RATE:
+            tasks += [(game_key, factor) for factor in game_range]
+    for hint_key, hint_info in hint_data.items():
+        for field in HINT_PARAMETERS:
+            if field in hint_info:
+                tasks += [(f"{hint_key}:{field}", factor) for factor in hint_range]
+    return tasks
+
+
+def perturbed_spec(game_data, hint_data, parameter, factor):
+    """項目 parameter に factor を掛けたスペック表のコピーを返す"""
+    game_data, hint_data = copy.deepcopy(game_data), copy.deepcopy(hint_data)
+    hint_key, _, field = parameter.partition(":")
+    if field:
+        hint_data[hint_key][field] *= factor
+        return game_data, hint_data
+    is_probability = IS_PROBABILITY_RATE[parameter]
+    for setting, value in game_data[parameter].items():
+        # %表示の確率は1を超えないようにする（1/X表示は分母に掛けるので確率は 1/factor 倍になる）
+        game_data[parameter][setting] = min(value * factor, 1.0) if is_probability else value * factor
+    return game_data, hint_data
+
+
+def posterior_shift(baseline, posteriors):
+    """基準の事後確率からの変化。データのない行（NaN）は除く"""
+    valid = ~(np.isnan(baseline).any(axis=1) | np.isnan(posteriors).any(axis=1))
+    if not valid.any():
+        return 0.0, 0.0, np.zeros(6)
+    distance = 0.5 * np.abs(posteriors[valid] - baseline[valid]).sum(axis=1)
+    return float(distance.mean()), float(distance.max()), posteriors[valid].mean(axis=0) - baseline[valid].mean(axis=0)
+
+
+def _attach_dataset(name, num_records, game_data, hint_data):
+    """ワーカーの初期化: 共有メモリのデータセットを参照し、基準の事後確率を一度だけ計算する"""
+    # 解放（unlink）は作成した親プロセスが行う。resource_tracker は親と共有なので、ここで追跡から外してはいけない
+    memory = shared_memory.SharedMemory(name=name)
+    records = np.ndarray((num_records,), dtype=RECORD_DTYPE, buffer=memory.buf)
+    _worker.update(memory=memory, records=records, game_data=game_data, hint_data=hint_data,
+                   baseline=predict_setting_batch(records, compile_model(game_data, hint_data)))
+
+
+def _run_task(task):
+    parameter, factor = task
+    model = compile_model(*perturbed_spec(_worker["game_data"], _worker["hint_data"], parameter, factor))
+    posteriors = predict_setting_batch(_worker["records"], model)
+    return SweepResult(parameter, factor, *posterior_shift(_worker["baseline"], posteriors))
+
+
+def run_sweep(records, game_data, hint_data, tasks, workers=None):
+    """tasks（sweep_parameters の戻り値）を推測し直し、SweepResult のリストを返す"""
+    if workers == 1:
+        _worker.update(records=records, game_data=game_data, hint_data=hint_data,
+                       baseline=predict_setting_batch(records, compile_model(game_data, hint_data)))
+        return [_run_task(task) for task in tasks]
+
+    memory = shared_memory.SharedMemory(create=True, size=max(records.nbytes, 1))
+    try:
+        np.ndarray(records.shape, dtype=RECORD_DTYPE, buffer=memory.buf)[:] = records
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach_dataset,
+                                 initargs=(memory.name, len(records), game_data, hint_data)) as executor:
+            return list(executor.map(_run_task, tasks))
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def summarize(results):
+    """項目ごとに、範囲の両端のうち変化の大きい方をとり、変化の大きい順に並べる"""
+    by_parameter = {}
+    for result in results:
+        if result.parameter not in by_parameter or result.mean_shift > by_parameter[result.parameter].mean_shift:
+            by_parameter[result.parameter] = result
+    return sorted(by_parameter.values(), key=lambda result: result.mean_shift, reverse=True)
+
+
+def simulated_dataset(num_records, games, seed=SEED):
+    """設定1〜6を同数ずつ混ぜた疑似データセット（records の構造化配列）"""
+    rng = np.random.default_rng(seed)
+    sizes = [len(part) for part in np.array_split(np.arange(num_records), 6)]
+    parts = [simulate_sessions(setting, size, games, rng) for setting, size in enumerate(sizes, start=1)]
+    return records_from_columns({key: np.concatenate([part[key] for part in parts]) for key in parts[0]})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="スペック表の各項目が推測結果に与える影響を調べる")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--records", help="データセット（records.py pack で作った .npy）")
+    source.add_argument("--simulate", type=int, default=12_000, help="疑似データセットの件数（--records がない場合）")
+    parser.add_argument("--games", type=int, default=5000, help="疑似データセットの1台あたりのゲーム数")
+    parser.add_argument("--machine", default=DEFAULT_MACHINE)
+    parser.add_argument("--revision", type=int, help="スペック表の版（省略時は最新）")
+    parser.add_argument("--game-range", type=float, nargs=2, default=DEFAULT_GAME_RANGE, metavar=("LOW", "HIGH"),
+                        help="GAME_DATA の行に掛ける倍率の範囲")
+    parser.add_argument("--hint-range", type=float, nargs=2, default=DEFAULT_HINT_RANGE, metavar=("LOW", "HIGH"),
+                        help="示唆の倍率に掛ける倍率の範囲")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU数）")
+    parser.add_argument("--top", type=int, default=20, help="表示する項目数")
+    parser.add_argument("--json", help="全項目の結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.machine, args.revision)
+    records = load_records(args.records, mmap=False) if args.records else simulated_dataset(args.simulate, args.games)
+    tasks = sweep_parameters(spec.game_data, spec.hint_data, args.game_range, args.hint_range)
+    results = run_sweep(records, spec.game_data, spec.hint_data, tasks, workers=args.workers)
+
+    print(f"{len(records)}件 × {len(tasks)}通り（事後確率の変化 = 全変動距離）")
+    print(f"{'項目':<40}{'倍率':>8}{'平均変化':>10}{'最大変化':>10}  設定1〜6の平均の変化")
+    for result in summarize(results)[:args.top]:
+        shifts = " ".join(f"{value:+.3f}" for value in result.setting_shift)
+        print(f"{result.parameter:<40}{result.factor:>8g}{result.mean_shift:>10.4f}{result.max_shift:>10.4f}  {shifts}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump([{**result._asdict(), "setting_shift": result.setting_shift.tolist()} for result in results],
+                      json_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+セッションのイベントログから、事後確率の推移（100Gごと、CZ・AT当選ごとなど）を求める。
+
+イベントは SettingEstimator.add と同じ (入力キー, 回数) の組。ログ全体の累積和（プレフィックス和）を
+一度だけ計算し、全チェックポイントの集計値をそこから取り出して、まとめて推測する。
+チェックポイントごとに predict_setting をやり直す O(K·E) の計算が O(E + K) になる。
+"""
+import csv
+from collections import namedtuple
+
+import numpy as np
+
+from core import INPUT_KEYS, normalize_log_likelihoods, log_likelihood_matrix
+
+# 既定で推移を記録するイベント（CZ当選・AT初当り）
+DEFAULT_CHECKPOINT_KEYS = ("cz_total_count", "at_first_hit_count")
+DEFAULT_EVERY_GAMES = 100
+
+# 推移の結果
+# event_indices: 各チェックポイントが何番目のイベントの直後か、games: その時点の総ゲーム数、
+# posteriors: 形状(K, 6)の事後確率（データが矛盾していて推測できない時点の行はNaN）
+Trajectory = namedtuple("Trajectory", ["event_indices", "games", "posteriors"])
+
+
+def parse_event_log(lines):
+    """
+    CSV形式のイベントログ（1行 = 入力キー,回数、回数は省略時1）を (入力キー, 回数) のリストにする。
+    空行と # で始まる行は読み飛ばす。
+    """
+    events = []
+    for line_number, row in enumerate(csv.reader(lines), start=1):
+        if not row or not row[0].strip() or row[0].startswith("#"):
+            continue
+        key = row[0].strip()
+        if key not in INPUT_KEYS:
+            raise ValueError(f"{line_number}行目: 未知の入力キーです: {key}")
+        try:
+            count = int(row[1]) if len(row) > 1 and row[1].strip() else 1
+        except ValueError:
+            raise ValueError(f"{line_number}行目: 回数は整数で指定してください: {row[1]}") from None
+        if count < 0:
+            raise ValueError(f"{line_number}行目: 回数は0以上で指定してください: {count}")
+        events.append((key, count))
+    return events
+
+
+def cumulative_counts(events):
+    """
+    各イベント直後の集計値を求める。
+    戻り値: (入力キーのリスト, 形状(E, キー数)の累積回数)
+    """
+    keys = list(dict.fromkeys(key for key, _ in events))
+    columns = {key: index for index, key in enumerate(keys)}
+    increments = np.zeros((len(events), len(keys)))
+    for row, (key, count) in enumerate(events):
+        increments[row, columns[key]] = count
+    return keys, np.cumsum(increments, axis=0)
+
+
+def checkpoint_indices(events, every_games=DEFAULT_EVERY_GAMES, on_keys=DEFAULT_CHECKPOINT_KEYS):
+    """
+    推移を記録するイベントの番号を返す。
+    総ゲーム数が every_games の倍数をまたいだイベントと、on_keys のイベントの直後、それに最後のイベント。
+    """
+    games = np.cumsum([count if key == "total_game_count" else 0 for key, count in events])
+    previous_games = np.concatenate(([0], games[:-1]))
+    crossed = (games // every_games > previous_games // every_games) if every_games else np.zeros(len(events), dtype=bool)
+    marked = crossed | np.array([key in on_keys for key, _ in events], dtype=bool)
+    if len(events):
+        marked[-1] = True
+    return np.flatnonzero(marked)
+
+
+def posterior_trajectory(events, checkpoints=None, model=None):
+    """
+    イベントログの各チェックポイントでの事後確率を求める。
+    checkpoints: イベントの番号の配列（省略時は checkpoint_indices の既定）
+    model: core.compile_model の戻り値（省略時は既定のスペック表）
+    データがまだない時点の事後確率は均等（1/6）にし、データが矛盾している時点は NaN のままにする。
+    """
+    if checkpoints is None:
+        checkpoints = checkpoint_indices(events)
+    checkpoints = np.asarray(checkpoints, dtype=np.intp)
+    if not len(events) or not len(checkpoints):
+        return Trajectory(checkpoints, np.zeros(len(checkpoints)), np.full((len(checkpoints), 6), 1 / 6))
+
+    keys, counts = cumulative_counts(events)
+    selected = counts[checkpoints]
+    columns = {key: selected[:, index] for index, key in enumerate(keys)}
+    posteriors = normalize_log_likelihoods(log_likelihood_matrix(columns, model))
+    posteriors[~selected.any(axis=1)] = 1 / 6
+    games = columns.get("total_game_count", np.zeros(len(checkpoints)))
+    return Trajectory(checkpoints, games, posteriors)